@@ -94,6 +94,7 @@ def main():
                 "parakeet.simulate.image=parakeet.command_line.simulate:image",
                 "parakeet.simulate.simple=parakeet.command_line.simulate:simple",
                 "parakeet.simulate.ctf=parakeet.command_line.simulate:ctf",
+                "parakeet.simulate.all=parakeet.command_line.simulate:all_stages",
                 "parakeet.analyse.reconstruct=parakeet.command_line.analyse:reconstruct",
                 "parakeet.analyse.average_particles=parakeet.command_line.analyse:average_particles",
                 "parakeet.analyse.average_all_particles=parakeet.command_line.analyse:average_all_particles",
@@ -103,6 +104,8 @@ def main():
         },
         extras_require={
             "build_sphinx": ["sphinx", "sphinx_rtd_theme"],
+            "compression": ["blosc", "hdf5plugin"],
+            "mpi": ["mpi4py"],
             "test": tests_require,
         },
         include_package_data=True,
@@ -28,6 +28,13 @@ def reconstruct(image_filename, rec_filename, microscope, simulation, device="gp
     """
     Reconstruct the volume using 3D CTF correction
 
+    Args:
+        image_filename (str): The input image filename
+        rec_filename (str): The output reconstruction filename
+        microscope (object): The microscope model
+        simulation (dict): The simulation parameters
+        device (str): The device to use (cpu, gpu or gpu:N to select a GPU)
+
     """
 
     # Ensure mrc file
@@ -51,6 +58,12 @@ def reconstruct(image_filename, rec_filename, microscope, simulation, device="gp
     astigmatism_angle = microscope.lens.phi_12
     phase_shift = 0
 
+    # Split off the GPU index since guanaco takes the bare device
+    device, _, gpu_index = device.partition(":")
+    assert device in ["cpu", "gpu"]
+    assert gpu_index == "" or (device == "gpu" and gpu_index.isdigit())
+    kwargs = {} if gpu_index == "" else {"gpu_index": int(gpu_index)}
+
     # Do the reconstruction
     guanaco.reconstruct_file(
         input_filename=image_filename,
@@ -65,6 +78,7 @@ def reconstruct(image_filename, rec_filename, microscope, simulation, device="gp
         astigmatism_angle=astigmatism_angle,
         phase_shift=phase_shift,
         device=device,
+        **kwargs,
     )
 
 
@@ -9,15 +9,11 @@
 # which is included in the root directory of this package.
 #
 import argparse
-import gemmi
+import functools
 import logging
 import logging.config
-import numpy
 import random
-import scipy.signal
-import parakeet.io
-import parakeet.config
-import parakeet.sample
+import tempfile
 
 # Get the logger
 logger = logging.getLogger(__name__)
@@ -60,26 +56,71 @@ def rebin(data, shape):
         shape (tuple): The new shape
 
     """
+    import numpy
+
     # Get pairs of (shape, bin factor) for each dimension
     factors = numpy.array([(d, c // d) for d, c in zip(shape, data.shape)])
 
-    # Rebin the array
-    for i in range(len(factors)):
-        data = scipy.signal.decimate(data, factors[i][1], axis=i)
-    # data = data.reshape(factors.flatten())
-    # for i in range(len(shape)):
-    #     data = data.sum(-1 * (i + 1))
+    # If the bin factors divide the array exactly then take the mean over
+    # each block. Otherwise fall back to decimating along each axis
+    if all(c % d == 0 for d, c in zip(shape, data.shape)):
+        data = data.reshape(factors.flatten())
+        data = data.mean(axis=tuple(range(1, 2 * len(factors), 2)))
+    else:
+        import scipy.signal
+
+        for i in range(len(factors)):
+            data = scipy.signal.decimate(data, factors[i][1], axis=i)
     return data
 
 
-def export(argv=None):
+def _int_tuple(value, n):
     """
-    Convert the input file type to a different file type
+    Convert a comma separated string to a tuple of ints
+
+    Args:
+        value (str): The string (e.g. "1,2,3")
+        n (int): The expected number of ints
+
+    Returns:
+        tuple: The tuple of ints
 
     """
-    # Create the argument parser
-    parser = argparse.ArgumentParser(description="Read a PDB file")
+    try:
+        result = tuple(int(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int tuple: {value}")
+    if len(result) != n:
+        raise argparse.ArgumentTypeError(
+            f"expected {n} comma separated ints, got {len(result)}: {value}"
+        )
+    return result
+
+
+def _int_tuple_list(value, n):
+    """
+    Convert a semicolon separated list of comma separated strings to a list
+    of tuples of ints
+
+    Args:
+        value (str): The string (e.g. "1,2;3,4")
+        n (int): The expected number of ints in each tuple
+
+    Returns:
+        list: The list of tuples of ints
+
+    """
+    return [_int_tuple(v, n) for v in value.split(";")]
+
 
+def _add_export_args(parser):
+    """
+    Add the arguments for the export command
+
+    Args:
+        parser (object): The argument parser
+
+    """
     # Add an argument for the filename
     parser.add_argument("filename", type=str, default=None, help="The input filename")
 
@@ -95,7 +136,7 @@ def export(argv=None):
     )
     parser.add_argument(
         "--rot90",
-        type=bool,
+        action="store_true",
         default=False,
         dest="rot90",
         help="Rotate the image 90deg counter clockwise",
@@ -103,20 +144,24 @@ def export(argv=None):
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "--rotation_range",
-        type=str,
+        type=functools.partial(_int_tuple_list, n=2),
         default=None,
         dest="rotation_range",
-        help="Select a rotation range",
+        help="Select rotation ranges (start,stop;start,stop;...)",
     )
     group.add_argument(
         "--select_images",
-        type=str,
+        type=functools.partial(_int_tuple, n=3),
         default=None,
         dest="select_images",
         help="Select a range of images (start,stop,step)",
     )
     parser.add_argument(
-        "--roi", type=str, default=None, dest="roi", help="Select a region of interest"
+        "--roi",
+        type=functools.partial(_int_tuple, n=4),
+        default=None,
+        dest="roi",
+        help="Select a region of interest (x0,y0,x1,y1)",
     )
     parser.add_argument(
         "--complex_mode",
@@ -159,56 +204,82 @@ def export(argv=None):
         help="The maximum pixel value when exporting to an image",
     )
 
+
+def export(argv=None):
+    """
+    Convert the input file type to a different file type
+
+    """
+    # Create the argument parser
+    parser = argparse.ArgumentParser(description="Read a PDB file")
+
+    # Add the arguments
+    _add_export_args(parser)
+
     # Parse the arguments
     args = parser.parse_args(argv)
 
+    # Import this here so the help path does not pay for it
+    import parakeet.io
+
     # Configure some basic logging
     configure_logging()
 
-    # Read the input
+    # Read the input and close it when done so the file is not left open
     logger.info(f"Reading data from {args.filename}")
     reader = parakeet.io.open(args.filename)
+    try:
+        _export(args, reader)
+    finally:
+        reader.close()
+
+
+def _export(args, reader):
+    """
+    Convert the input to the output
+
+    Args:
+        args (object): The parsed arguments
+        reader (object): The input reader
+
+    """
+    import numpy
+    import parakeet.io
+
+    # Read all the angles and positions at once
+    angles = numpy.asarray(reader.angle[:])
+    positions = numpy.asarray(reader.position[:])
 
     # Get the shape and indices to read
     if args.select_images is not None:
-        logger.info("Selecting image range %s" % args.select_images)
-        item = tuple(map(int, args.select_images.split(",")))
-        indices = list(range(*item))
+        logger.info("Selecting image range %s" % (args.select_images,))
+        indices = list(range(*args.select_images))
     else:
         indices = list(range(reader.shape[0]))
 
     # Get the shape and indices to read
     if args.rotation_range is not None:
-        args.rotation_range = args.rotation_range.split(";")
-        indices = []
-        for p in range(0, len(args.rotation_range)):
-            current_rotation_range = tuple(map(int, args.rotation_range[p].split(",")))
-            for i in range(reader.shape[0]):
-                angle = reader.angle[i]
-                if (
-                    angle >= current_rotation_range[0]
-                    and angle < current_rotation_range[1]
-                ):
-                    indices.append(i)
-                    logger.info(f"    Image {i} added as within the rotation range(s)")
-        indices = list(set(indices))
-        indices.sort()
+        selected = numpy.zeros(angles.shape, dtype=bool)
+        for current_rotation_range in args.rotation_range:
+            selected |= (angles >= current_rotation_range[0]) & (
+                angles < current_rotation_range[1]
+            )
+        indices = numpy.flatnonzero(selected).tolist()
+        logger.info(f"    Images {indices} added as within the rotation range(s)")
 
     # Interlace the images
     if args.interlace is not None:
         if args.interlace >= 1:
-            interlaced_indices = []
-            for i in range(args.interlace):
-                interlaced_indices.extend(
-                    [indices[j] for j in range(i, len(indices), args.interlace)]
-                )
-            indices = interlaced_indices
+            indices = numpy.asarray(indices, dtype=int)
+            indices = numpy.concatenate(
+                [indices[i :: args.interlace] for i in range(args.interlace)]
+            ).tolist()
         else:
             random.shuffle(indices)
 
     # Get the region of interest
     if args.roi is not None:
-        x0, y0, x1, y1 = tuple(map(int, args.roi.split(",")))
+        x0, y0, x1, y1 = args.roi
         assert x1 > x0
         assert y1 > y0
     else:
@@ -220,6 +291,19 @@ def export(argv=None):
     else:
         dtype = reader.data.dtype.name
 
+    # Get the function to transform the image. In complex mode the image is
+    # passed through unchanged so there is no need to call anything
+    transform = {
+        "complex": None,
+        "real": numpy.real,
+        "imaginary": numpy.imag,
+        "amplitude": numpy.abs,
+        "phase": numpy.angle,
+        "phase_unwrap": lambda x: numpy.unwrap(numpy.angle(x)),
+        "square": lambda x: numpy.square(numpy.abs(x)),
+        "imaginary_square": lambda x: numpy.square(x.imag) + 1,
+    }[args.complex_mode]
+
     # Set the dataset shape
     shape = (len(indices), y1 - y0, x1 - x0)
 
@@ -240,66 +324,62 @@ def export(argv=None):
         args.output, shape=shape, pixel_size=pixel_size, dtype=dtype
     )
 
-    # If converting to images, determine min and max
+    # If converting to images and the min and max are not given then compute
+    # them as the images are read so each image is only read once. The images
+    # are held in a scratch buffer and written once the min and max are known
+    buffer = None
     if writer.is_image_writer:
         if args.vmin is None or args.vmax is None:
             logger.info("Computing min and max of dataset:")
+            buffer = numpy.memmap(
+                tempfile.TemporaryFile(), dtype=dtype, mode="w+", shape=shape
+            )
             min_image = []
             max_image = []
-            for i in indices:
-
-                # Transform if necessary
-                image = {
-                    "complex": lambda x: x,
-                    "real": lambda x: numpy.real(x),
-                    "imaginary": lambda x: numpy.imag(x),
-                    "amplitude": lambda x: numpy.abs(x),
-                    "phase": lambda x: numpy.real(numpy.angle(x)),
-                    "phase_unwrap": lambda x: numpy.unwrap(numpy.real(numpy.angle(x))),
-                    "square": lambda x: numpy.abs(x) ** 2,
-                    "imaginary_square": lambda x: numpy.imag(x) ** 2 + 1,
-                }[args.complex_mode](reader.data[i, y0:y1, x0:x1])
-
-                min_image.append(numpy.min(image))
-                max_image.append(numpy.max(image))
-                logger.info(
-                    "    Reading image %d: min/max: %.2f/%.2f"
-                    % (i, min_image[-1], max_image[-1])
-                )
-            writer.vmin = min(min_image)
-            writer.vmax = max(max_image)
-            logger.info("Min: %f" % writer.vmin)
-            logger.info("Max: %f" % writer.vmax)
-        if args.vmin:
+        else:
             writer.vmin = args.vmin
-        if args.vmax:
             writer.vmax = args.vmax
 
-    # Write the data
+    # If the input is an HDF5 dataset then read each image directly into a
+    # single preallocated array rather than allocating a new one every time
+    if hasattr(reader.data, "read_direct"):
+        image_buffer = numpy.empty((y1 - y0, x1 - x0), dtype=reader.data.dtype)
+    else:
+        image_buffer = None
+
+    # Write the data. Progress is only logged every so often since logging
+    # every image is a noticeable cost for long series
+    log_interval = 64
     for j, i in enumerate(indices):
-        logger.info(f"    Copying image {i} -> image {j}")
+        log_progress = j % log_interval == 0 or j == len(indices) - 1
+        if log_progress:
+            logger.info(f"    Copying image {i} -> image {j} ({j+1}/{len(indices)})")
 
         # Get the image info
-        image = reader.data[i, y0:y1, x0:x1]
-        angle = reader.angle[i]
-        position = reader.position[i]
+        if image_buffer is not None:
+            reader.data.read_direct(image_buffer, numpy.s_[i, y0:y1, x0:x1])
+            image = image_buffer
+        else:
+            image = reader.data[i, y0:y1, x0:x1]
 
-        # Rotate if necessary
+        # Rotate if necessary. Note that numpy.rot90 returns a view so the
+        # rotated image is only copied when it is written below
         if args.rot90:
             image = numpy.rot90(image)
-            position = (position[1], position[0], position[2])
 
         # Transform if necessary
-        image = {
-            "complex": lambda x: x,
-            "real": lambda x: numpy.real(x),
-            "imaginary": lambda x: numpy.imag(x),
-            "amplitude": lambda x: numpy.abs(x),
-            "phase": lambda x: numpy.real(numpy.angle(x)),
-            "phase_unwrap": lambda x: numpy.unwrap(numpy.real(numpy.angle(x))),
-            "square": lambda x: numpy.abs(x) ** 2,
-            "imaginary_square": lambda x: numpy.imag(x) ** 2 + 1,
-        }[args.complex_mode](image)
+        if transform is not None:
+            image = transform(image)
+
+        # Compute the min and max
+        if buffer is not None:
+            min_image.append(numpy.min(image))
+            max_image.append(numpy.max(image))
+            if log_progress:
+                logger.info(
+                    "    Reading image %d: min/max: %.2f/%.2f"
+                    % (i, min_image[-1], max_image[-1])
+                )
 
         # Rebin the array
         if args.rebin != 1:
@@ -307,9 +387,31 @@ def export(argv=None):
             image = rebin(image, new_shape)
 
         # Write the image info
-        writer.data[j, :, :] = image
-        writer.angle[j] = angle
-        writer.position[j] = position
+        if buffer is not None:
+            buffer[j, :, :] = image
+        else:
+            writer.data[j, :, :] = image
+
+    # Write the angles and positions for all the images at once
+    out_angles = angles[indices]
+    out_positions = positions[indices]
+    if args.rot90:
+        out_positions = out_positions[:, [1, 0, 2]]
+    writer.angle[:] = out_angles
+    writer.position[:, :] = out_positions
+
+    # Write the buffered images now the min and max are known
+    if buffer is not None:
+        writer.vmin = min(min_image)
+        writer.vmax = max(max_image)
+        logger.info("Min: %f" % writer.vmin)
+        logger.info("Max: %f" % writer.vmax)
+        if args.vmin:
+            writer.vmin = args.vmin
+        if args.vmax:
+            writer.vmax = args.vmax
+        for j in range(buffer.shape[0]):
+            writer.data[j, :, :] = buffer[j, :, :]
 
     # Update the writer
     writer.update()
@@ -342,6 +444,10 @@ def read_pdb():
         parser.print_help()
         exit(0)
 
+    # Import these here so the help path does not pay for them
+    import gemmi
+    import parakeet.sample
+
     # Configure some basic logging
     configure_logging()
 
@@ -14,6 +14,7 @@ import time
 import parakeet.analyse
 import parakeet.io
 import parakeet.command_line
+import parakeet.command_line.simulate
 import parakeet.config
 import parakeet.microscope
 import parakeet.sample
@@ -46,10 +47,10 @@ def reconstruct(args=None):
     parser.add_argument(
         "-d",
         "--device",
-        choices=["cpu", "gpu"],
+        type=parakeet.command_line.simulate._parse_device,
         default=None,
         dest="device",
-        help="Choose the device to use",
+        help="Choose the device to use (cpu, gpu or gpu:N to select a GPU)",
     )
     parser.add_argument(
         "-i",
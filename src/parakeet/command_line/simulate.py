@@ -9,220 +9,222 @@
 # which is included in the root directory of this package.
 #
 import argparse
+import contextlib
 import logging
-import numpy
+import re
 import time
-import parakeet.io
-import parakeet.command_line
-import parakeet.config
-import parakeet.microscope
-import parakeet.sample
-import parakeet.scan
-import parakeet.simulation
 from math import pi
 
 # Get the logger
 logger = logging.getLogger(__name__)
 
 
-def projected_potential(args=None):
+def _parse_device(value):
     """
-    Simulate the projected potential from the sample
+    Check the device string
 
-    """
+    Args:
+        value (str): The device (cpu, gpu or gpu:N to select a GPU)
 
-    # Get the start time
-    start_time = time.time()
-
-    # Create the argument parser
-    parser = argparse.ArgumentParser(
-        description="Simulate the exit wave from the sample"
-    )
+    Returns:
+        str: The device
 
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-d",
-        "--device",
-        choices=["cpu", "gpu"],
-        default=None,
-        dest="device",
-        help="Choose the device to use",
-    )
-    parser.add_argument(
-        "--cluster.max_workers",
-        type=int,
-        default=None,
-        dest="cluster_max_workers",
-        help="The maximum number of worker processes",
-    )
-    parser.add_argument(
-        "--cluster.method",
-        type=str,
-        choices=["sge"],
-        default=None,
-        dest="cluster_method",
-        help="The cluster method to use",
-    )
-    parser.add_argument(
-        "-s",
-        "--sample",
+    """
+    if re.match(r"^(cpu|gpu(:\d+)?)$", value) is None:
+        raise argparse.ArgumentTypeError(
+            f"invalid device: {value} (choose from cpu, gpu or gpu:N)"
+        )
+    return value
+
+
+# The argument to set the config file
+_CONFIG_ARGS = [
+    (
+        ("-c", "--config"),
+        dict(
+            type=str,
+            default=None,
+            dest="config",
+            help="The yaml file to configure the simulation",
+        ),
+    ),
+]
+
+# The arguments to set the device and cluster
+_DEVICE_ARGS = [
+    (
+        ("-d", "--device"),
+        dict(
+            type=_parse_device,
+            default=None,
+            dest="device",
+            metavar="{cpu,gpu,gpu:N}",
+            help="Choose the device to use",
+        ),
+    ),
+    (
+        ("--cluster.max_workers",),
+        dict(
+            type=int,
+            default=None,
+            dest="cluster_max_workers",
+            help="The maximum number of worker processes",
+        ),
+    ),
+    (
+        ("--cluster.method",),
+        dict(
+            type=str,
+            choices=["sge", "mpi"],
+            default=None,
+            dest="cluster_method",
+            help="The cluster method to use",
+        ),
+    ),
+]
+
+# The argument to set the sample filename
+_SAMPLE_ARG = (
+    ("-s", "--sample"),
+    dict(
         type=str,
         default="sample.h5",
         dest="sample",
         help="The filename for the sample",
-    )
-
-    # Parse the arguments
-    args = parser.parse_args(args=args)
+    ),
+)
 
-    # Configure some basic logging
-    parakeet.command_line.configure_logging()
-
-    # Set the command line args in a dict
-    command_line = {}
-    if args.device is not None:
-        command_line["device"] = args.device
-    if args.cluster_max_workers is not None or args.cluster_method is not None:
-        command_line["cluster"] = {}
-    if args.cluster_max_workers is not None:
-        command_line["cluster"]["max_workers"] = args.cluster_max_workers
-    if args.cluster_method is not None:
-        command_line["cluster"]["method"] = args.cluster_method
+# The argument to set the exit wave filename
+_EXIT_WAVE_ARG = (
+    ("-e", "--exit_wave"),
+    dict(
+        type=str,
+        default="exit_wave.h5",
+        dest="exit_wave",
+        help="The filename for the exit wave",
+    ),
+)
 
-    # Load the full configuration
-    config = parakeet.config.load(args.config, command_line)
+# The argument to set the optics filename
+_OPTICS_ARG = (
+    ("-o", "--optics"),
+    dict(
+        type=str,
+        default="optics.h5",
+        dest="optics",
+        help="The filename for the optics",
+    ),
+)
 
-    # Print some options
-    parakeet.config.show(config)
+# The argument to set the image filename
+_IMAGE_ARG = (
+    ("-i", "--image"),
+    dict(
+        type=str,
+        default="image.h5",
+        dest="image",
+        help="The filename for the image",
+    ),
+)
 
-    # Create the microscope
-    microscope = parakeet.microscope.new(**config["microscope"])
+# The argument to set the image data type
+_DTYPE_ARG = (
+    ("--dtype",),
+    dict(
+        type=str,
+        choices=["uint16", "float16", "float32"],
+        default="uint16",
+        dest="dtype",
+        help=(
+            "The data type of the image counts. Note that float16 only holds "
+            "integer counts exactly up to 2048 and rounds larger counts"
+        ),
+    ),
+)
+
+
+def _make_parser(description, arguments):
+    """
+    Make the argument parser
 
-    # Create the sample
-    logger.info(f"Loading sample from {args.sample}")
-    sample = parakeet.sample.load(args.sample)
+    Args:
+        description (str): The parser description
+        arguments (list): A list of (flags, kwargs) for each argument
 
-    # Create the scan
-    if config["scan"]["step_pos"] == "auto":
-        radius = sample.shape_radius
-        config["scan"]["step_pos"] = config["scan"]["step_angle"] * radius * pi / 180.0
-    scan = parakeet.scan.new(**config["scan"])
-    if scan.positions[-1] > sample.containing_box[1][0]:
-        raise RuntimeError("Scan goes beyond sample containing box")
+    Returns:
+        object: The argument parser
 
-    # Create the simulation
-    simulation = parakeet.simulation.projected_potential(
-        microscope=microscope,
-        sample=sample,
-        scan=scan,
-        device=config["device"],
-        simulation=config["simulation"],
-        cluster=config["cluster"],
+    """
+    parser = argparse.ArgumentParser(description=description)
+    for flags, kwargs in arguments:
+        parser.add_argument(*flags, **kwargs)
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        default=False,
+        dest="dry_run",
+        help="Set up the simulation but do not run it (to profile the setup)",
     )
-
-    # Run the simulation
-    simulation.run()
-
-    # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
+    return parser
 
 
-def exit_wave(args=None):
+@contextlib.contextmanager
+def _timed(label):
     """
-    Simulate the exit wave from the sample
+    Log the time taken to run the enclosed block
+
+    Args:
+        label (str): The label for the log message
 
     """
+    start_ns = time.perf_counter_ns()
+    yield
+    logger.info("%s: %.3f seconds" % (label, (time.perf_counter_ns() - start_ns) / 1e9))
 
-    # Get the start time
-    start_time = time.time()
 
-    # Create the argument parser
-    parser = argparse.ArgumentParser(
-        description="Simulate the exit wave from the sample"
-    )
-
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-d",
-        "--device",
-        choices=["cpu", "gpu"],
-        default=None,
-        dest="device",
-        help="Choose the device to use",
-    )
-    parser.add_argument(
-        "--cluster.max_workers",
-        type=int,
-        default=None,
-        dest="cluster_max_workers",
-        help="The maximum number of worker processes",
-    )
-    parser.add_argument(
-        "--cluster.method",
-        type=str,
-        choices=["sge"],
-        default=None,
-        dest="cluster_method",
-        help="The cluster method to use",
-    )
-    parser.add_argument(
-        "-s",
-        "--sample",
-        type=str,
-        default="sample.h5",
-        dest="sample",
-        help="The filename for the sample",
-    )
-    parser.add_argument(
-        "-e",
-        "--exit_wave",
-        type=str,
-        default="exit_wave.h5",
-        dest="exit_wave",
-        help="The filename for the exit wave",
-    )
+def _args_to_command_line(args):
+    """
+    Get the config overrides given on the command line
 
-    # Parse the arguments
-    args = parser.parse_args(args=args)
+    Args:
+        args (object): The parsed arguments
 
-    # Configure some basic logging
-    parakeet.command_line.configure_logging()
+    Returns:
+        dict: The command line configuration
 
-    # Set the command line args in a dict
+    """
+    device = getattr(args, "device", None)
+    cluster_max_workers = getattr(args, "cluster_max_workers", None)
+    cluster_method = getattr(args, "cluster_method", None)
     command_line = {}
-    if args.device is not None:
-        command_line["device"] = args.device
-    if args.cluster_max_workers is not None or args.cluster_method is not None:
+    if device is not None:
+        command_line["device"] = device
+    if cluster_max_workers is not None or cluster_method is not None:
         command_line["cluster"] = {}
-    if args.cluster_max_workers is not None:
-        command_line["cluster"]["max_workers"] = args.cluster_max_workers
-    if args.cluster_method is not None:
-        command_line["cluster"]["method"] = args.cluster_method
+    if cluster_max_workers is not None:
+        command_line["cluster"]["max_workers"] = cluster_max_workers
+    if cluster_method is not None:
+        command_line["cluster"]["method"] = cluster_method
+    return command_line
 
-    # Load the full configuration
-    config = parakeet.config.load(args.config, command_line)
 
-    # Print some options
-    parakeet.config.show(config)
+def _load_sample_and_scan(args, config, axis):
+    """
+    Load the sample and create the scan, truncating it where it goes beyond
+    the sample containing box
 
-    # Create the microscope
-    microscope = parakeet.microscope.new(**config["microscope"])
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
+        axis (int): The axis of the containing box to check the scan against
+
+    Returns:
+        tuple: The sample and scan objects
+
+    """
+    import numpy
+    import parakeet.sample
+    import parakeet.scan
 
     # Create the sample
     logger.info(f"Loading sample from {args.sample}")
@@ -233,12 +235,36 @@ def exit_wave(args=None):
         radius = sample.shape_radius
         config["scan"]["step_pos"] = config["scan"]["step_angle"] * radius * pi / 180.0
     scan = parakeet.scan.new(**config["scan"])
-    if scan.positions[-1] > sample.containing_box[1][1]:
-        raise RuntimeError("Scan goes beyond sample containing box")
 
-    # Create the simulation
-    simulation = parakeet.simulation.exit_wave(
-        microscope=microscope,
+    # Only simulate the images before the first position outside the box
+    outside = numpy.flatnonzero(scan.positions > sample.containing_box[1][axis])
+    if len(outside) > 0:
+        if outside[0] == 0:
+            raise RuntimeError("Scan goes beyond sample containing box")
+        logger.warning(
+            "Scan goes beyond sample containing box: simulating %d/%d images"
+            % (outside[0], len(scan))
+        )
+        scan = scan.truncate(outside[0])
+
+    # Return the sample and scan
+    return sample, scan
+
+
+def _setup_projected_potential(args, config):
+    """
+    Get the projected potential simulation inputs
+
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
+
+    Returns:
+        dict: The simulation keyword arguments
+
+    """
+    sample, scan = _load_sample_and_scan(args, config, 0)
+    return dict(
         sample=sample,
         scan=scan,
         device=config["device"],
@@ -246,108 +272,43 @@ def exit_wave(args=None):
         cluster=config["cluster"],
     )
 
-    # Create the writer
-    logger.info(f"Opening file: {args.exit_wave}")
-    writer = parakeet.io.new(
-        args.exit_wave,
-        shape=simulation.shape,
-        pixel_size=simulation.pixel_size,
-        dtype=numpy.complex64,
-    )
-
-    # Run the simulation
-    simulation.run(writer)
-
-    # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
-
-
-def optics(args=None):
-    """
-    Simulate the optics
 
+def _setup_exit_wave(args, config):
     """
+    Get the exit wave simulation inputs
 
-    # Get the start time
-    start_time = time.time()
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
 
-    # Create the argument parser
-    parser = argparse.ArgumentParser(description="Simulate the optics")
+    Returns:
+        dict: The simulation keyword arguments
 
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-d",
-        "--device",
-        choices=["cpu", "gpu"],
-        default=None,
-        dest="device",
-        help="Choose the device to use",
-    )
-    parser.add_argument(
-        "--cluster.max_workers",
-        type=int,
-        default=None,
-        dest="cluster_max_workers",
-        help="The maximum number of worker processes",
-    )
-    parser.add_argument(
-        "--cluster.method",
-        type=str,
-        choices=["sge"],
-        default=None,
-        dest="cluster_method",
-        help="The cluster method to use",
-    )
-    parser.add_argument(
-        "-e",
-        "--exit_wave",
-        type=str,
-        default="exit_wave.h5",
-        dest="exit_wave",
-        help="The filename for the exit wave",
-    )
-    parser.add_argument(
-        "-o",
-        "--optics",
-        type=str,
-        default="optics.h5",
-        dest="optics",
-        help="The filename for the optics",
+    """
+    sample, scan = _load_sample_and_scan(args, config, 1)
+    return dict(
+        sample=sample,
+        scan=scan,
+        device=config["device"],
+        simulation=config["simulation"],
+        cluster=config["cluster"],
     )
 
-    # Parse the arguments
-    args = parser.parse_args(args=args)
 
-    # Configure some basic logging
-    parakeet.command_line.configure_logging()
+def _setup_optics(args, config):
+    """
+    Get the optics simulation inputs
 
-    # Set the command line args in a dict
-    command_line = {}
-    if args.device is not None:
-        command_line["device"] = args.device
-    if args.cluster_max_workers is not None or args.cluster_method is not None:
-        command_line["cluster"] = {}
-    if args.cluster_max_workers is not None:
-        command_line["cluster"]["max_workers"] = args.cluster_max_workers
-    if args.cluster_method is not None:
-        command_line["cluster"]["method"] = args.cluster_method
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
 
-    # Load the full configuration
-    config = parakeet.config.load(args.config, command_line)
+    Returns:
+        dict: The simulation keyword arguments
 
-    # Print some options
-    parakeet.config.show(config)
-
-    # Create the microscope
-    microscope = parakeet.microscope.new(**config["microscope"])
+    """
+    import parakeet.io
+    import parakeet.scan
 
     # Create the exit wave data
     logger.info(f"Loading sample from {args.exit_wave}")
@@ -361,9 +322,8 @@ def optics(args=None):
     config["scan"]["num_images"] = exit_wave.num_images
     scan = parakeet.scan.new(**config["scan"])
 
-    # Create the simulation
-    simulation = parakeet.simulation.optics(
-        microscope=microscope,
+    # Return the simulation inputs
+    return dict(
         exit_wave=exit_wave,
         scan=scan,
         device=config["device"],
@@ -372,255 +332,502 @@ def optics(args=None):
         cluster=config["cluster"],
     )
 
-    # Create the writer
-    logger.info(f"Opening file: {args.optics}")
-    writer = parakeet.io.new(
-        args.optics,
-        shape=simulation.shape,
-        pixel_size=simulation.pixel_size,
-        dtype=numpy.float32,
-    )
 
-    # Run the simulation
-    simulation.run(writer)
+def _setup_ctf(args, config):
+    """
+    Get the ctf simulation inputs
 
-    # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
 
+    Returns:
+        dict: The simulation keyword arguments
 
-def ctf(args=None):
     """
-    Simulate the ctf
+    return dict(simulation=config["simulation"])
 
+
+def _setup_image(args, config):
     """
+    Get the image simulation inputs
 
-    # Get the start time
-    start_time = time.time()
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
 
-    # Create the argument parser
-    parser = argparse.ArgumentParser(description="Simulate the ctf")
+    Returns:
+        dict: The simulation keyword arguments
 
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-o",
-        type=str,
-        default="ctf.h5",
-        dest="output",
-        help="The filename for the output",
+    """
+    import numpy
+    import parakeet.io
+    import parakeet.scan
+
+    # Create the exit wave data
+    logger.info(f"Loading sample from {args.optics}")
+    optics = parakeet.io.open(args.optics)
+
+    # Create the scan
+    config["scan"]["start_angle"] = optics.start_angle
+    config["scan"]["start_pos"] = optics.start_position
+    config["scan"]["step_angle"] = optics.step_angle
+    config["scan"]["step_pos"] = optics.step_position
+    config["scan"]["num_images"] = optics.num_images
+    scan = parakeet.scan.new(**config["scan"])
+    scan.angles = numpy.asarray(optics.angle[:])
+    scan.positions = numpy.asarray(optics.position[:, 1])
+
+    # Return the simulation inputs
+    return dict(
+        optics=optics,
+        scan=scan,
+        device=config["device"],
+        simulation=config["simulation"],
+        cluster=config["cluster"],
+        dtype=args.dtype,
     )
 
-    # Parse the arguments
-    args = parser.parse_args(args=args)
+
+def _setup_simple(args, config):
+    """
+    Get the simple simulation inputs
+
+    Args:
+        args (object): The parsed arguments
+        config (dict): The configuration
+
+    Returns:
+        dict: The simulation keyword arguments
+
+    """
+    import parakeet.sample
+
+    # Create the exit wave data
+    logger.info(f"Loading sample from {args.atoms}")
+    atoms = parakeet.sample.AtomData.from_text_file(args.atoms)
+
+    # Return the simulation inputs
+    return dict(atoms=atoms, device=config["device"], simulation=config["simulation"])
+
+
+# The specification of each simulation stage. Each stage has the parser
+# description and arguments, a function to get the simulation inputs, the
+# name of the argument with the output filename (if any), the output dtype
+# (unless given by a --dtype argument), whether to write direct chunks and
+# the compression filter
+_STAGES = {
+    "projected_potential": dict(
+        description="Simulate the exit wave from the sample",
+        arguments=_CONFIG_ARGS + _DEVICE_ARGS + [_SAMPLE_ARG],
+        setup=_setup_projected_potential,
+        output=None,
+        dtype=None,
+        direct_chunk=False,
+        compression=None,
+    ),
+    "exit_wave": dict(
+        description="Simulate the exit wave from the sample",
+        arguments=_CONFIG_ARGS + _DEVICE_ARGS + [_SAMPLE_ARG, _EXIT_WAVE_ARG],
+        setup=_setup_exit_wave,
+        output="exit_wave",
+        dtype="complex64",
+        direct_chunk=True,
+        compression="blosc",
+    ),
+    "optics": dict(
+        description="Simulate the optics",
+        arguments=_CONFIG_ARGS + _DEVICE_ARGS + [_EXIT_WAVE_ARG, _OPTICS_ARG],
+        setup=_setup_optics,
+        output="optics",
+        dtype="float32",
+        direct_chunk=True,
+        compression="blosc",
+    ),
+    "ctf": dict(
+        description="Simulate the ctf",
+        arguments=_CONFIG_ARGS
+        + [
+            (
+                ("-o",),
+                dict(
+                    type=str,
+                    default="ctf.h5",
+                    dest="output",
+                    help="The filename for the output",
+                ),
+            )
+        ],
+        setup=_setup_ctf,
+        output="output",
+        dtype="complex64",
+        direct_chunk=False,
+        compression=None,
+    ),
+    "image": dict(
+        description="Simulate the image",
+        arguments=_CONFIG_ARGS + [_OPTICS_ARG, _IMAGE_ARG, _DTYPE_ARG],
+        setup=_setup_image,
+        output="image",
+        dtype="float32",
+        direct_chunk=True,
+        compression=None,
+    ),
+    "simple": dict(
+        description="Simulate the image",
+        arguments=_CONFIG_ARGS
+        + [
+            (
+                ("-o", "--output"),
+                dict(
+                    type=str,
+                    default="output.h5",
+                    dest="output",
+                    help="The filename for the output",
+                ),
+            ),
+            (
+                ("atoms",),
+                dict(
+                    type=str,
+                    default=None,
+                    nargs="?",
+                    help="The filename for the input atoms",
+                ),
+            ),
+        ],
+        setup=_setup_simple,
+        output="output",
+        dtype="complex64",
+        direct_chunk=False,
+        compression=None,
+    ),
+}
+
+
+def _load_config_and_microscope(args):
+    """
+    Configure logging, load the full configuration and create the microscope
+
+    Args:
+        args (object): The parsed arguments
+
+    Returns:
+        tuple: The configuration and the microscope object
+
+    """
+    import parakeet.command_line
+    import parakeet.config
+    import parakeet.microscope
 
     # Configure some basic logging
     parakeet.command_line.configure_logging()
 
     # Load the full configuration
-    config = parakeet.config.load(args.config)
+    config = parakeet.config.load(args.config, _args_to_command_line(args))
 
     # Print some options
     parakeet.config.show(config)
 
     # Create the microscope
     microscope = parakeet.microscope.new(**config["microscope"])
+    return config, microscope
 
-    # Create the simulation
-    simulation = parakeet.simulation.ctf(
-        microscope=microscope, simulation=config["simulation"]
-    )
 
-    # Create the writer
-    logger.info(f"Opening file: {args.output}")
-    writer = parakeet.io.new(
-        args.output,
+def _open_writer(simulation, filename, dtype, direct_chunk, compression=None):
+    """
+    Open a file writer for the output of a simulation
+
+    Args:
+        simulation (object): The simulation object
+        filename (str): The output filename
+        dtype (str): The output data type
+        direct_chunk (bool): Write images directly as chunks
+        compression (str): The compression filter
+
+    Returns:
+        object: The file writer
+
+    """
+    import parakeet.io
+
+    logger.info(f"Opening file: {filename}")
+    return parakeet.io.new(
+        filename,
         shape=simulation.shape,
         pixel_size=simulation.pixel_size,
-        dtype=numpy.complex64,
+        dtype=dtype,
+        direct_chunk=direct_chunk,
+        chunks=(1,) + tuple(simulation.tile_shape),
+        compression=compression,
     )
 
-    # Run the simulation
-    simulation.run(writer)
 
-    # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
+def _log_dry_run(simulation, start_ns):
+    """
+    Log the simulation shape and setup time for a dry run
 
+    Args:
+        simulation (object): The simulation object
+        start_ns (int): The start time (ns)
 
-def image(args=None):
     """
-    Simulate the image with noise
+    logger.info(f"Dry run: not running simulation with shape {simulation.shape}")
+    logger.info(
+        "Time taken: %.3f seconds" % ((time.perf_counter_ns() - start_ns) / 1e9)
+    )
+
+
+def _run(stage, args=None):
+    """
+    Run a simulation stage
+
+    Args:
+        stage (str): The name of the simulation stage
+        args (list): The command line arguments
 
     """
 
     # Get the start time
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
 
-    # Create the argument parser
-    parser = argparse.ArgumentParser(description="Simulate the image")
+    # Get the stage specification
+    spec = _STAGES[stage]
 
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-o",
-        "--optics",
-        type=str,
-        default="optics.h5",
-        dest="optics",
-        help="The filename for the optics",
-    )
-    parser.add_argument(
-        "-i",
-        "--image",
-        type=str,
-        default="image.h5",
-        dest="image",
-        help="The filename for the image",
-    )
+    # Create the argument parser
+    parser = _make_parser(spec["description"], spec["arguments"])
 
     # Parse the arguments
     args = parser.parse_args(args=args)
 
-    # Configure some basic logging
-    parakeet.command_line.configure_logging()
+    # Import these here so the help path does not pay for them
+    import parakeet.io
+    import parakeet.simulation
 
-    # Load the full configuration
-    config = parakeet.config.load(args.config)
+    # Load the configuration and create the microscope
+    config, microscope = _load_config_and_microscope(args)
 
-    # Print some options
-    parakeet.config.show(config)
+    # Create the simulation
+    with _timed("Time taken to load the inputs"):
+        simulation = getattr(parakeet.simulation, stage)(
+            microscope=microscope, **spec["setup"](args, config)
+        )
 
-    # Create the microscope
-    microscope = parakeet.microscope.new(**config["microscope"])
+    # Stop here if only the setup is wanted
+    if args.dry_run:
+        _log_dry_run(simulation, start_ns)
+        return
 
-    # Create the exit wave data
-    logger.info(f"Loading sample from {args.optics}")
-    optics = parakeet.io.open(args.optics)
+    # Create the writer
+    if spec["output"] is not None:
+        writer = _open_writer(
+            simulation,
+            getattr(args, spec["output"]),
+            getattr(args, "dtype", spec["dtype"]),
+            spec["direct_chunk"],
+            spec["compression"],
+        )
+
+        # Buffer images which are not written directly as chunks
+        if writer.is_nexus_writer and not spec["direct_chunk"]:
+            writer = parakeet.io.BufferedWriter(writer)
+    else:
+        writer = None
 
-    # Create the scan
-    config["scan"]["start_angle"] = optics.start_angle
-    config["scan"]["start_pos"] = optics.start_position
-    config["scan"]["step_angle"] = optics.step_angle
-    config["scan"]["step_pos"] = optics.step_position
-    config["scan"]["num_images"] = optics.num_images
-    scan = parakeet.scan.new(**config["scan"])
-    scan.angles = [optics.angle[i] for i in range(optics.data.shape[0])]
-    scan.positions = [optics.position[i, 1] for i in range(optics.data.shape[0])]
+    # Run the simulation
+    with _timed("Time taken to run the simulation"):
+        simulation.run_async(writer)
+    if writer is not None:
+        writer.update()
 
-    # Create the simulation
-    simulation = parakeet.simulation.image(
-        microscope=microscope,
-        optics=optics,
-        scan=scan,
-        device=config["device"],
-        simulation=config["simulation"],
-        cluster=config["cluster"],
+    # Write some timing stats
+    logger.info(
+        "Time taken: %.3f seconds" % ((time.perf_counter_ns() - start_ns) / 1e9)
     )
 
-    # Create the writer
-    logger.info(f"Opening file: {args.image}")
-    writer = parakeet.io.new(
-        args.image,
-        shape=simulation.shape,
-        pixel_size=simulation.pixel_size,
-        dtype=numpy.float32,
-    )
 
-    # Run the simulation
-    simulation.run(writer)
+def projected_potential(args=None):
+    """
+    Simulate the projected potential from the sample
 
-    # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
+    """
+    _run("projected_potential", args)
+
+
+def exit_wave(args=None):
+    """
+    Simulate the exit wave from the sample
+
+    """
+    _run("exit_wave", args)
 
 
-def simple():
+def optics(args=None):
+    """
+    Simulate the optics
+
+    """
+    _run("optics", args)
+
+
+def ctf(args=None):
+    """
+    Simulate the ctf
+
+    """
+    _run("ctf", args)
+
+
+def image(args=None):
+    """
+    Simulate the image with noise
+
+    """
+    _run("image", args)
+
+
+def simple(args=None):
     """
     Simulate the image
 
+    """
+    _run("simple", args)
+
+
+def _run_in_memory(stage, simulation, filename=None):
+    """
+    Run a simulation stage keeping the output in memory
+
+    Args:
+        stage (str): The name of the simulation stage
+        simulation (object): The simulation object
+        filename (str): Also write the output to this file if set
+
+    Returns:
+        object: A reader for the output to pass to the next stage
+
+    """
+    import parakeet.io
+
+    # Run the simulation
+    writer = parakeet.io.MemoryWriter(
+        simulation.shape, simulation.pixel_size, _STAGES[stage]["dtype"]
+    )
+    with _timed(f"Time taken to run the {stage} simulation"):
+        simulation.run(writer)
+
+    # Optionally save the output
+    if filename is not None:
+        output = _open_writer(
+            simulation,
+            filename,
+            writer.dtype,
+            False,
+            _STAGES[stage]["compression"],
+        )
+        output.data[:] = writer.data
+        output.angle[:] = writer.angle
+        output.position[:, :] = writer.position
+        if output.is_nexus_writer:
+            output.shift[:, :] = writer.shift
+        output.update()
+    return writer.as_reader()
+
+
+def all_stages(args=None):
+    """
+    Simulate the exit wave, optics and image in one process, passing the
+    output of each stage to the next in memory rather than through files
+
     """
 
     # Get the start time
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
 
     # Create the argument parser
-    parser = argparse.ArgumentParser(description="Simulate the image")
-
-    # Add some command line arguments
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=str,
-        default=None,
-        dest="config",
-        help="The yaml file to configure the simulation",
-    )
-    parser.add_argument(
-        "-o",
-        "--output",
-        type=str,
-        default="output.h5",
-        dest="output",
-        help="The filename for the output",
-    )
-    parser.add_argument(
-        "atoms",
-        type=str,
-        default=None,
-        nargs="?",
-        help="The filename for the input atoms",
+    parser = _make_parser(
+        "Simulate the exit wave, optics and image",
+        _CONFIG_ARGS
+        + _DEVICE_ARGS
+        + [
+            _SAMPLE_ARG,
+            (
+                ("-e", "--exit_wave"),
+                dict(
+                    type=str,
+                    default=None,
+                    dest="exit_wave",
+                    help="The filename for the exit wave (not written by default)",
+                ),
+            ),
+            (
+                ("-o", "--optics"),
+                dict(
+                    type=str,
+                    default=None,
+                    dest="optics",
+                    help="The filename for the optics (not written by default)",
+                ),
+            ),
+            _IMAGE_ARG,
+            _DTYPE_ARG,
+        ],
     )
 
     # Parse the arguments
-    args = parser.parse_args()
-
-    # Configure some basic logging
-    parakeet.command_line.configure_logging()
+    args = parser.parse_args(args=args)
 
-    # Load the full configuration
-    config = parakeet.config.load(args.config)
+    # Import this here so the help path does not pay for it
+    import parakeet.simulation
 
-    # Print some options
-    parakeet.config.show(config)
+    # Load the configuration and create the microscope
+    config, microscope = _load_config_and_microscope(args)
 
-    # Create the microscope
-    microscope = parakeet.microscope.new(**config["microscope"])
+    # Simulate the exit wave
+    with _timed("Time taken to load the inputs"):
+        kwargs = _setup_exit_wave(args, config)
+    simulation = parakeet.simulation.exit_wave(microscope=microscope, **kwargs)
+    if args.dry_run:
+        _log_dry_run(simulation, start_ns)
+        return
+    exit_wave = _run_in_memory("exit_wave", simulation, args.exit_wave)
 
-    # Create the exit wave data
-    logger.info(f"Loading sample from {args.atoms}")
-    atoms = parakeet.sample.AtomData.from_text_file(args.atoms)
+    # Release the sample now that the exit wave has been simulated. Only
+    # the inputs of the current stage are then held in memory.
+    scan = kwargs["scan"]
+    del kwargs, simulation
 
-    # Create the simulation
-    simulation = parakeet.simulation.simple(
+    # Simulate the optics from the exit wave in memory
+    simulation = parakeet.simulation.optics(
         microscope=microscope,
-        atoms=atoms,
+        exit_wave=exit_wave,
+        scan=scan,
         device=config["device"],
         simulation=config["simulation"],
+        sample=config["sample"],
+        cluster=config["cluster"],
     )
+    optics = _run_in_memory("optics", simulation, args.optics)
 
-    # Create the writer
-    logger.info(f"Opening file: {args.output}")
-    writer = parakeet.io.new(
-        args.output,
-        shape=simulation.shape,
-        pixel_size=simulation.pixel_size,
-        dtype=numpy.complex64,
-    )
+    # Release the exit wave now that the optics have been simulated
+    del exit_wave, simulation
 
-    # Run the simulation
-    simulation.run(writer)
+    # Simulate the image from the optics in memory
+    simulation = parakeet.simulation.image(
+        microscope=microscope,
+        optics=optics,
+        scan=scan,
+        device=config["device"],
+        simulation=config["simulation"],
+        cluster=config["cluster"],
+        dtype=args.dtype,
+    )
+    writer = _open_writer(simulation, args.image, args.dtype, True)
+    with _timed("Time taken to run the image simulation"):
+        simulation.run_async(writer)
+    writer.update()
 
     # Write some timing stats
-    logger.info("Time taken: %.2f seconds" % (time.time() - start_time))
+    logger.info(
+        "Time taken: %.3f seconds" % ((time.perf_counter_ns() - start_ns) / 1e9)
+    )
@@ -9,9 +9,20 @@
 # which is included in the root directory of this package.
 #
 import copy
+import functools
+import hashlib
+import json
 import logging
+import os
+import pickle
 import yaml
 
+# Use the LibYAML loader if it is available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # Get the logger
 logger = logging.getLogger(__name__)
 
@@ -25,14 +36,19 @@ def temp_directory():
     return "_parakeet"
 
 
-def default():
+@functools.lru_cache(maxsize=1)
+def _default_json():
     """
+    The default configuration is parsed from yaml once and kept as a JSON
+    string, which is much quicker to parse than the yaml on each call
+
     Return:
-        dict: the default configuration
+        str: the default configuration as a JSON string
 
     """
-    return yaml.safe_load(
-        """
+    return json.dumps(
+        yaml.load(
+            """
 
         sample:
 
@@ -159,10 +175,21 @@ def default():
             method: null
             max_workers: 1
 
-    """
+    """,
+            Loader=SafeLoader,
+        )
     )
 
 
+def default():
+    """
+    Return:
+        dict: the default configuration
+
+    """
+    return json.loads(_default_json())
+
+
 def deepmerge(a, b):
     """
     Perform a deep merge of two dictionaries
@@ -226,6 +253,116 @@ def difference(master, config):
     return walk(master, config)
 
 
+# The maximum number of parsed config files kept in the cache directory
+_MAX_CACHE_FILES = 64
+
+
+def _cache_directory():
+    """
+    Returns:
+        str: The directory in which to cache parsed config files
+
+    """
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(root, "parakeet")
+
+
+@functools.lru_cache(maxsize=1)
+def _version():
+    """
+    Returns:
+        str: The package version used to invalidate the config cache
+
+    """
+    try:
+        from importlib.metadata import version
+
+        return version("python-parakeet")
+    except Exception:
+        return "unknown"
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_yaml(contents):
+    """
+    Parse the yaml file contents
+
+    The parsed contents are cached in memory and in a pickle file in the
+    cache directory named by the hash of the package version and the contents.
+    Only the most recently written _MAX_CACHE_FILES files are kept
+
+    Args:
+        contents (bytes): The yaml file contents
+
+    Returns:
+        object: The parsed yaml
+
+    """
+
+    # Get the cache filename from the hash of the version and contents
+    digest = hashlib.blake2b(_version().encode() + b"\0" + contents).hexdigest()
+    cache = os.path.join(_cache_directory(), f"{digest}.pkl")
+
+    # Try to read from the cache
+    try:
+        with open(cache, "rb") as infile:
+            return pickle.load(infile)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    # Parse the yaml and try to write the cache. Write to a temporary file
+    # and rename it so that concurrent jobs never see a partial cache file
+    result = yaml.load(contents, Loader=SafeLoader)
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        temp = f"{cache}.{os.getpid()}"
+        with open(temp, "wb") as outfile:
+            pickle.dump(result, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, cache)
+        _prune_cache(os.path.dirname(cache))
+    except OSError:
+        logger.debug(f"Unable to write config cache {cache}")
+    return result
+
+
+def _prune_cache(directory):
+    """
+    Remove the oldest cache files so at most _MAX_CACHE_FILES are kept
+
+    Args:
+        directory (str): The cache directory
+
+    """
+    filenames = [
+        os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".pkl")
+    ]
+    if len(filenames) > _MAX_CACHE_FILES:
+        filenames.sort(key=os.path.getmtime)
+        for filename in filenames[: len(filenames) - _MAX_CACHE_FILES]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+
+def read_yaml(filename):
+    """
+    Read a yaml file
+
+    Args:
+        filename (str): The yaml filename
+
+    Returns:
+        object: The parsed yaml
+
+    """
+    with open(filename, "rb") as infile:
+        contents = infile.read()
+    return copy.deepcopy(_parse_yaml(contents))
+
+
 def load(config=None, command_line=None):
     """
     Load the configuration from the various inputs
@@ -245,8 +382,7 @@ def load(config=None, command_line=None):
 
     # If the yaml configuration is set then merge the configuration
     if config:
-        with open(config) as infile:
-            config_file = yaml.safe_load(infile)
+        config_file = read_yaml(config)
     else:
         config_file = {}
 
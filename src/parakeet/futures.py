@@ -12,6 +12,12 @@ import parakeet.config
 
 
 def as_completed(futures):
+    import concurrent.futures
+
+    # The mpi executor returns standard futures
+    if all(isinstance(f, concurrent.futures.Future) for f in futures):
+        return concurrent.futures.as_completed(futures)
+
     import dask.distributed
 
     return dask.distributed.as_completed(futures)
@@ -22,14 +28,13 @@ def factory(method="sge", max_workers=1):
     Configure the future to use for parallel processing
 
     Args:
-        method (str): The cluster method (sge)
+        method (str): The cluster method (sge or mpi)
         max_workers (int): The number of worker processes
 
     """
-    import dask_jobqueue
-    import dask.distributed
-
     if method == "sge":
+        import dask_jobqueue
+        import dask.distributed
 
         # Create the SGECluster object
         # For each worker:
@@ -58,6 +63,14 @@ def factory(method="sge", max_workers=1):
 
         # Return the client
         executor = dask.distributed.Client(cluster)
+    elif method == "mpi":
+        import mpi4py.futures
+
+        # Create the MPI pool executor. The program should be launched with
+        # "mpiexec -n N python -m mpi4py.futures ..." so that rank 0 runs the
+        # program, submits the jobs and writes the output while the other
+        # ranks run the jobs.
+        executor = mpi4py.futures.MPIPoolExecutor(max_workers=max_workers)
     else:
         raise RuntimeError(f"Unknown multiprocessing method: {method}")
 
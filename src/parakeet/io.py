@@ -8,17 +8,211 @@
 # This code is distributed under the GPLv3 license, a copy of
 # which is included in the root directory of this package.
 #
+import functools
 import h5py
 import numpy
 import mrcfile
 import os
+import warnings
 import PIL.Image
 
+# Try to import the HDF5 compression filter plugins. Importing hdf5plugin
+# registers the filters so that compressed files can be read.
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+# Try to import blosc to compress chunks before writing them directly
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
 try:
     FEI_EXTENDED_HEADER_DTYPE = mrcfile.dtypes.FEI1_EXTENDED_HEADER_DTYPE
 except Exception:
     FEI_EXTENDED_HEADER_DTYPE = mrcfile.dtypes.FEI_EXTENDED_HEADER_DTYPE
 
+# The file format for each filename extension
+FILE_FORMATS = {
+    ".mrc": "mrc",
+    ".h5": "nexus",
+    ".hdf5": "nexus",
+    ".nx": "nexus",
+    ".nxs": "nexus",
+    ".nexus": "nexus",
+    ".nxtomo": "nexus",
+    ".png": "image",
+    ".jpg": "image",
+    ".jpeg": "image",
+    ".tif": "image",
+    ".tiff": "image",
+}
+
+
+def _file_format(filename):
+    """
+    Get the file format from the filename extension
+
+    Args:
+        filename (str): The filename
+
+    Returns:
+        str: The file format (or None if the extension is unknown)
+
+    """
+    return FILE_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def _grid_index(item, shape):
+    """
+    Get the column and row indices of the elements of a 2D array selected by
+    an item, without creating index arrays for the whole array
+
+    Args:
+        item (object): The item used to index the array
+        shape (tuple): The shape of the array
+
+    Returns:
+        tuple: The column and row indices (ints or arrays)
+
+    """
+    if not isinstance(item, tuple):
+        item = (item,)
+    item = item + (slice(None),) * (2 - len(item))
+
+    # Index arrays need the full grid to follow numpy's indexing rules
+    if not all(isinstance(i, (int, numpy.integer, slice)) for i in item):
+        x = numpy.broadcast_to(numpy.arange(shape[1]), shape)
+        y = numpy.broadcast_to(numpy.arange(shape[0])[:, None], shape)
+        return x[item], y[item]
+
+    # Get the selected rows and columns directly from the ints and slices
+    y = range(shape[0])[item[0]]
+    x = range(shape[1])[item[1]]
+    if isinstance(y, range):
+        y = numpy.arange(y.start, y.stop, y.step)
+        if isinstance(x, range):
+            y = y[:, None]
+    if isinstance(x, range):
+        x = numpy.arange(x.start, x.stop, x.step)
+    if isinstance(x, numpy.ndarray) or isinstance(y, numpy.ndarray):
+        y, x = numpy.broadcast_arrays(y, x)
+    return x, y
+
+
+def _write_column(dataset, index, data):
+    """
+    Write values to the given indices of a 1D dataset in as few writes as
+    possible (h5py only accepts increasing indices for a fancy selection)
+
+    Args:
+        dataset (object): The dataset
+        index (array): The indices to write
+        data (array): The values to write
+
+    """
+    if len(index) == 1:
+        dataset[index[0]] = data[0]
+    elif len(index) > 1:
+        step = numpy.diff(index)
+        if numpy.all(step == 1):
+            dataset[index[0] : index[-1] + 1] = data
+        elif numpy.all(step > 0):
+            dataset[index] = data
+        else:
+            values = dataset[:]
+            values[index] = data
+            dataset[:] = values
+
+
+def _min_max(data, block_size=1 << 18):
+    """
+    Compute the minimum and maximum of an array in one pass through memory
+
+    The array is reduced in blocks which are small enough to stay in the
+    cache, so that computing the maximum of each block after the minimum does
+    not read the block from memory again.
+
+    Args:
+        data (array): The array
+        block_size (int): The number of elements in each block
+
+    Returns:
+        tuple: The minimum and maximum
+
+    """
+    data = numpy.ravel(data)
+    if data.size <= block_size:
+        return numpy.min(data), numpy.max(data)
+    minimum = []
+    maximum = []
+    for i in range(0, data.size, block_size):
+        block = data[i : i + block_size]
+        minimum.append(numpy.min(block))
+        maximum.append(numpy.max(block))
+    return numpy.min(minimum), numpy.max(maximum)
+
+
+def _chunk_cache(chunks, dtype):
+    """
+    Get the HDF5 chunk cache settings to hold a few chunks of a dataset
+
+    The default 1 MB cache cannot hold a single image sized chunk so any
+    partial access to a chunk reads (and decompresses) the whole chunk again.
+
+    Args:
+        chunks (tuple): The chunk shape (or None if not chunked)
+        dtype (object): The data type
+
+    Returns:
+        dict: The keyword arguments for h5py.File
+
+    """
+    chunk_bytes = 0
+    if chunks is not None:
+        chunk_bytes = int(numpy.prod(chunks)) * numpy.dtype(dtype).itemsize
+    return dict(
+        rdcc_nbytes=max(64 * 1024 * 1024, 4 * chunk_bytes),
+        rdcc_nslots=100003,
+        rdcc_w0=1.0,
+    )
+
+
+def _scale_to_uint8(data, s1, s0, block_size=1 << 17):
+    """
+    Scale an image to 8 bit with clipping in one pass through memory
+
+    The image is scaled in blocks of rows in a scratch buffer which is small
+    enough to stay in the cache, so that the scale, clip and cast of each
+    block do not read the block from memory again.
+
+    Args:
+        data (array): The 2D image
+        s1 (float): The scale factor
+        s0 (float): The offset
+        block_size (int): The number of elements in each block
+
+    Returns:
+        array: The 8 bit image
+
+    """
+    image = numpy.empty(data.shape, dtype=numpy.uint8)
+    rows = max(1, block_size // max(1, data.shape[1]))
+    scratch = numpy.empty(
+        (min(rows, data.shape[0]), data.shape[1]),
+        dtype=numpy.result_type(data.dtype, numpy.float32),
+    )
+    for i in range(0, data.shape[0], rows):
+        block = data[i : i + rows]
+        buffer = scratch[: block.shape[0]]
+        numpy.multiply(block, s1, out=buffer)
+        numpy.add(buffer, s0, out=buffer)
+        numpy.clip(buffer, 0, 255, out=buffer)
+        image[i : i + rows] = buffer
+    return image
+
 
 class Writer(object):
     """
@@ -120,6 +314,60 @@ class MrcFileWriter(Writer):
 
     """
 
+    class DataProxy(object):
+        """
+        Proxy interface to the data which keeps the statistics of each whole
+        image as it is written so that the header statistics can be updated
+        without reading all the data again
+
+        """
+
+        def __init__(self, handle):
+            self.handle = handle
+
+            # The min, max, mean and variance of each image (nan if unknown)
+            self.stats = numpy.full((handle.data.shape[0], 4), numpy.nan)
+            self.track = not numpy.iscomplexobj(handle.data)
+
+        @property
+        def shape(self):
+            """
+            The shape property
+
+            """
+            return self.handle.data.shape
+
+        @property
+        def dtype(self):
+            """
+            The dtype property
+
+            """
+            return self.handle.data.dtype
+
+        def __getitem__(self, item):
+            return self.handle.data[item]
+
+        def __setitem__(self, item, data):
+            self.handle.data[item] = data
+
+            # Compute the statistics of whole images while they are in memory
+            # and forget the statistics of images which are partly written
+            if not isinstance(item, tuple):
+                item = (item,)
+            if (
+                self.track
+                and isinstance(item[0], (int, numpy.integer))
+                and all(i == slice(None) for i in item[1:])
+            ):
+                image = self.handle.data[item[0]]
+                self.stats[item[0]] = _min_max(image) + (
+                    image.mean(dtype=numpy.float64),
+                    image.var(dtype=numpy.float64),
+                )
+            else:
+                self.stats[item[0]] = numpy.nan
+
     class AngleProxy(object):
         """
         Proxy interface to angles
@@ -128,9 +376,10 @@ class MrcFileWriter(Writer):
 
         def __init__(self, handle):
             self.handle = handle
+            self.column = self.handle.extended_header["Alpha tilt"]
 
         def __setitem__(self, item, data):
-            self.handle.extended_header[item]["Alpha tilt"] = data
+            self.column[item] = data
 
     class PositionProxy(object):
         """
@@ -138,30 +387,27 @@ class MrcFileWriter(Writer):
 
         """
 
+        # The extended header field for each column (z is not stored)
+        fields = ("Shift X", "Shift Y")
+
         def __init__(self, handle):
             self.handle = handle
-            n = len(self.handle.extended_header)
-            self.x, self.y = numpy.meshgrid(numpy.arange(0, 3), numpy.arange(0, n))
+            self.columns = [self.handle.extended_header[name] for name in self.fields]
+            self.shape = (len(self.handle.extended_header), 3)
 
         def __setitem__(self, item, data):
 
-            # Set the items
-            def setitem_internal(j, i, d):
-                if i == 0:
-                    self.handle.extended_header[j]["Shift X"] = d
-                elif i == 1:
-                    self.handle.extended_header[j]["Shift Y"] = d
-
             # Get the indices from the item
-            x = self.x[item]
-            y = self.y[item]
+            x, y = _grid_index(item, self.shape)
 
-            # Set the item
+            # Set the selected items of each column in one assignment
             if isinstance(x, numpy.ndarray):
-                for j, i, d in zip(y, x, data):
-                    setitem_internal(j, i, d)
-            else:
-                setitem_internal(y, x, data)
+                data = numpy.broadcast_to(data, x.shape)
+                for i, column in enumerate(self.columns):
+                    mask = x == i
+                    column[y[mask]] = data[mask]
+            elif x < len(self.columns):
+                self.columns[x][y] = data
 
     def __init__(self, filename, shape, pixel_size, dtype="uint8"):
         """
@@ -187,36 +433,28 @@ class MrcFileWriter(Writer):
         elif dtype == "complex128":
             dtype = numpy.dtype(numpy.complex64)
 
-        # Open the handle to the mrcfile
-        self.handle = mrcfile.new_mmap(
-            filename,
-            shape=(0, 0, 0),
-            mrc_mode=mrcfile.utils.mode_from_dtype(dtype),
-            overwrite=True,
-        )
+        # Open the handle to a new empty mrcfile
+        self.handle = mrcfile.mrcmemmap.MrcMemmap(filename, "w+", overwrite=True)
 
-        # Setup the extended header
+        # Setup the extended header with the pixel size for each image
         extended_header = numpy.zeros(shape=shape[0], dtype=FEI_EXTENDED_HEADER_DTYPE)
+        extended_header["Pixel size X"] = pixel_size * 1e-10
+        extended_header["Pixel size Y"] = pixel_size * 1e-10
+        extended_header["Application"] = "RFI Simulation"
 
-        # Set the extended header
-        self.handle._check_writeable()
+        # Set the extended header and open the data array with the final
+        # header size, then write the complete header to the file once
         self.handle._close_data()
         self.handle._extended_header = extended_header
         self.handle.header.nsymbt = extended_header.nbytes
         self.handle.header.exttyp = "FEI1"
         self.handle._open_memmap(dtype, shape)
         self.handle.update_header_from_data()
-        self.handle.flush()
-
-        # Set the pixel size
         self.handle.voxel_size = pixel_size
-        for i in range(self.handle.extended_header.shape[0]):
-            self.handle.extended_header[i]["Pixel size X"] = pixel_size * 1e-10
-            self.handle.extended_header[i]["Pixel size Y"] = pixel_size * 1e-10
-            self.handle.extended_header[i]["Application"] = "RFI Simulation"
+        self.handle.flush()
 
         # Set the data array
-        self._data = self.handle.data
+        self._data = MrcFileWriter.DataProxy(self.handle)
         self._angle = MrcFileWriter.AngleProxy(self.handle)
         self._position = MrcFileWriter.PositionProxy(self.handle)
 
@@ -233,7 +471,19 @@ class MrcFileWriter(Writer):
         Update before closing
 
         """
-        self.handle.update_header_stats()
+
+        # Combine the statistics of each image if every image has been
+        # written whole, otherwise compute the statistics from all the data
+        stats = self._data.stats
+        if stats.shape[0] > 0 and numpy.all(numpy.isfinite(stats)):
+            mean = numpy.mean(stats[:, 2])
+            var = numpy.mean(stats[:, 3] + (stats[:, 2] - mean) ** 2)
+            self.handle.header.dmin = numpy.min(stats[:, 0])
+            self.handle.header.dmax = numpy.max(stats[:, 1])
+            self.handle.header.dmean = numpy.float32(mean)
+            self.handle.header.rms = numpy.float32(numpy.sqrt(var))
+        else:
+            self.handle.update_header_stats()
 
 
 class NexusWriter(Writer):
@@ -242,36 +492,96 @@ class NexusWriter(Writer):
 
     """
 
+    class DataProxy(object):
+        """
+        Proxy interface to the data which writes whole images directly as
+        chunks, bypassing the HDF5 type conversion and filter pipeline
+
+        """
+
+        def __init__(self, handle, encode=None):
+            self.handle = handle
+            self.encode = encode
+
+        @property
+        def shape(self):
+            """
+            The shape property
+
+            """
+            return self.handle.shape
+
+        @property
+        def dtype(self):
+            """
+            The dtype property
+
+            """
+            return self.handle.dtype
+
+        def __getitem__(self, item):
+            return self.handle[item]
+
+        def __setitem__(self, item, data):
+
+            # Check if the item selects a whole image
+            if not isinstance(item, tuple):
+                item = (item,)
+            if (
+                isinstance(item[0], (int, numpy.integer))
+                and all(i == slice(None) for i in item[1:])
+                and numpy.shape(data) == self.shape[1:]
+            ):
+                self.write_chunk(range(self.shape[0])[item[0]], data)
+            else:
+                self.handle[item] = data
+
+        def write_chunk(self, index, data, filter_mask=0):
+            """
+            Write a whole image as a chunk
+
+            Args:
+                index (int): The image index
+                data (object): The image array or the already encoded chunk
+                filter_mask (int): The HDF5 filter mask for encoded chunks
+
+            """
+            # Pass the image buffer through without copying it to bytes
+            if isinstance(data, numpy.ndarray):
+                data = numpy.ascontiguousarray(data, dtype=self.dtype)
+                if self.encode is not None:
+                    data = self.encode(data)
+            self.handle.id.write_direct_chunk(
+                (index,) + (0,) * (len(self.shape) - 1), data, filter_mask
+            )
+
     class ShiftProxy(object):
         """
         Proxy interface to positions
 
         """
 
+        # The dataset for each column
+        fields = ("x_shift", "y_shift")
+
         def __init__(self, handle):
             self.handle = handle
-            n = self.handle["x_shift"].shape[0]
-            self.x, self.y = numpy.meshgrid(numpy.arange(0, 2), numpy.arange(0, n))
+            self.datasets = [self.handle[name] for name in self.fields]
+            self.shape = (self.datasets[0].shape[0], len(self.fields))
 
         def __setitem__(self, item, data):
 
-            # Set the items
-            def setitem_internal(j, i, d):
-                if i == 0:
-                    self.handle["x_shift"][j] = d
-                elif i == 1:
-                    self.handle["y_shift"][j] = d
-
             # Get the indices from the item
-            x = self.x[item]
-            y = self.y[item]
+            x, y = _grid_index(item, self.shape)
 
-            # Set the item
+            # Set the selected items of each column in as few writes as possible
             if isinstance(x, numpy.ndarray):
-                for j, i, d in zip(y, x, data):
-                    setitem_internal(j, i, d)
+                data = numpy.broadcast_to(data, x.shape)
+                for i, dataset in enumerate(self.datasets):
+                    mask = x == i
+                    _write_column(dataset, y[mask], data[mask])
             else:
-                setitem_internal(y, x, data)
+                self.datasets[x][y] = data
 
     class PositionProxy(object):
         """
@@ -279,34 +589,38 @@ class NexusWriter(Writer):
 
         """
 
+        # The dataset for each column
+        fields = ("x_translation", "y_translation", "z_translation")
+
         def __init__(self, handle):
             self.handle = handle
-            n = self.handle["x_translation"].shape[0]
-            self.x, self.y = numpy.meshgrid(numpy.arange(0, 3), numpy.arange(0, n))
+            self.datasets = [self.handle[name] for name in self.fields]
+            self.shape = (self.datasets[0].shape[0], len(self.fields))
 
         def __setitem__(self, item, data):
 
-            # Set the items
-            def setitem_internal(j, i, d):
-                if i == 0:
-                    self.handle["x_translation"][j] = d
-                elif i == 1:
-                    self.handle["y_translation"][j] = d
-                elif i == 2:
-                    self.handle["z_translation"][j] = d
-
             # Get the indices from the item
-            x = self.x[item]
-            y = self.y[item]
+            x, y = _grid_index(item, self.shape)
 
-            # Set the item
+            # Set the selected items of each column in as few writes as possible
             if isinstance(x, numpy.ndarray):
-                for j, i, d in zip(y, x, data):
-                    setitem_internal(j, i, d)
+                data = numpy.broadcast_to(data, x.shape)
+                for i, dataset in enumerate(self.datasets):
+                    mask = x == i
+                    _write_column(dataset, y[mask], data[mask])
             else:
-                setitem_internal(y, x, data)
-
-    def __init__(self, filename, shape, pixel_size, dtype="float32"):
+                self.datasets[x][y] = data
+
+    def __init__(
+        self,
+        filename,
+        shape,
+        pixel_size,
+        dtype="float32",
+        direct_chunk=False,
+        chunks=None,
+        compression=None,
+    ):
         """
         Initialise the writer
 
@@ -315,11 +629,23 @@ class NexusWriter(Writer):
             shape (tuple): The shape of the data
             pixel_size (float): The pixel size
             dtype (object): The data type of the data
+            direct_chunk (bool): Write whole images directly as chunks
+            chunks (tuple): The chunk shape of the data (default one image)
+            compression (str): The compression filter for the data (blosc
+                uses LZ4 with bitshuffle from hdf5plugin, gzip and lzf are
+                used with shuffle)
 
         """
 
+        # Chunk by image by default since images are written one at a time. An
+        # empty stack cannot have a chunk of one image so h5py chooses.
+        if chunks is None and all(s > 0 for s in shape):
+            chunks = (1,) + tuple(shape[1:])
+        if chunks is not None:
+            chunks = tuple(chunks)
+
         # Open the file for writing
-        self.handle = h5py.File(filename, "w")
+        self.handle = h5py.File(filename, "w", **_chunk_cache(chunks, dtype))
 
         # Create the entry
         entry = self.handle.create_group("entry")
@@ -333,10 +659,56 @@ class NexusWriter(Writer):
         # Create the detector
         detector = instrument.create_group("detector")
         detector.attrs["NX_class"] = "NXdetector"
-        detector.create_dataset("data", shape=shape, dtype=dtype)
-        detector["image_key"] = numpy.zeros(shape=shape[0])
-        detector["x_pixel_size"] = numpy.full(shape=shape[0], fill_value=pixel_size)
-        detector["y_pixel_size"] = numpy.full(shape=shape[0], fill_value=pixel_size)
+
+        # Get the compression filter arguments. Blosc chunks can be compressed
+        # before writing them directly if the blosc module is available. The
+        # builtin filters are used with the byte shuffle filter which makes
+        # floating point data much more compressible.
+        encode = None
+        if compression == "blosc":
+            if hdf5plugin is None:
+                warnings.warn("hdf5plugin not present, using lzf compression")
+                compression = "lzf"
+                filter_kwargs = dict(compression=compression, shuffle=True)
+            else:
+                filter_kwargs = dict(
+                    hdf5plugin.Blosc(
+                        cname="lz4", clevel=5, shuffle=hdf5plugin.Blosc.BITSHUFFLE
+                    )
+                )
+                if blosc is not None:
+                    encode = functools.partial(
+                        blosc.compress,
+                        typesize=numpy.dtype(dtype).itemsize,
+                        clevel=5,
+                        shuffle=blosc.BITSHUFFLE,
+                        cname="lz4",
+                    )
+        elif compression is not None:
+            filter_kwargs = dict(compression=compression, shuffle=True)
+        else:
+            filter_kwargs = {}
+
+        # Images can only be written directly as chunks if each chunk is a
+        # whole image and the chunks can be encoded for the filter (if any)
+        if chunks != (1,) + tuple(shape[1:]):
+            direct_chunk = False
+        if compression is not None and encode is None:
+            direct_chunk = False
+        detector.create_dataset(
+            "data", shape=shape, dtype=dtype, chunks=chunks, **filter_kwargs
+        )
+
+        # The constant per image values are stored as the fill value of an
+        # otherwise empty dataset so no array needs to be created or written
+        for name, value in [
+            ("image_key", 0),
+            ("x_pixel_size", pixel_size),
+            ("y_pixel_size", pixel_size),
+        ]:
+            detector.create_dataset(
+                name, shape=(shape[0],), dtype=numpy.float64, fillvalue=value
+            )
 
         # Create the sample
         sample = entry.create_group("sample")
@@ -361,7 +733,10 @@ class NexusWriter(Writer):
         data["image_key"] = detector["image_key"]
 
         # Set the data ptr
-        self._data = data["data"]
+        if direct_chunk:
+            self._data = NexusWriter.DataProxy(data["data"], encode)
+        else:
+            self._data = data["data"]
         self._angle = data["rotation_angle"]
         self._position = NexusWriter.PositionProxy(data)
         self._shift = NexusWriter.ShiftProxy(data)
@@ -409,19 +784,23 @@ class ImageWriter(Writer):
             assert data.shape[0] == self.shape[1]
             assert data.shape[1] == self.shape[2]
 
-            # Convert to squared amplitude
+            # Convert to squared amplitude, squaring the amplitude in place
             if numpy.iscomplexobj(data):
-                data = numpy.abs(data) ** 2
+                power = numpy.abs(data)
+                numpy.square(power, out=power)
+                data = power
                 self.vmin = None
                 self.vmax = None
 
             # Compute scale factors to put between 0 and 255
+            if self.vmin is None or self.vmax is None:
+                data_min, data_max = _min_max(data)
             if self.vmin is None:
-                vmin = numpy.min(data)
+                vmin = data_min
             else:
                 vmin = self.vmin
             if self.vmax is None:
-                vmax = numpy.max(data)
+                vmax = data_max
             else:
                 vmax = self.vmax
             s1 = 255.0 / (vmax - vmin)
@@ -429,7 +808,7 @@ class ImageWriter(Writer):
 
             # Save the image to file
             filename = self.template % (item[0] + 1)
-            image = (data * s1 + s0).astype(numpy.uint8)
+            image = _scale_to_uint8(data, s1, s0)
             PIL.Image.fromarray(image).save(filename)
 
     def __init__(self, template, shape=None, vmin=None, vmax=None):
@@ -483,6 +862,156 @@ class ImageWriter(Writer):
         self._data.vmax = vmax
 
 
+class MemoryWriter(Writer):
+    """
+    Write to arrays in memory
+
+    """
+
+    def __init__(self, shape, pixel_size, dtype="float32"):
+        """
+        Initialise the writer
+
+        Args:
+            shape (tuple): The shape of the data
+            pixel_size (float): The pixel size
+            dtype (object): The data type of the data
+
+        """
+        self._data = numpy.zeros(shape=shape, dtype=dtype)
+        self._angle = numpy.zeros(shape=shape[0], dtype=numpy.float32)
+        self._position = numpy.zeros(shape=(shape[0], 3), dtype=numpy.float32)
+        self._shift = numpy.zeros(shape=(shape[0], 2), dtype=numpy.float32)
+        self._pixel_size = pixel_size
+
+    def as_reader(self):
+        """
+        Return a reader for the data so it can be used as the input to
+        another simulation without going through a file
+
+        Returns:
+            object: The reader
+
+        """
+        return Reader(None, self._data, self._angle, self._position, self._pixel_size)
+
+
+class BufferedWriter(Writer):
+    """
+    Buffer consecutive images and write them to another writer in blocks
+
+    """
+
+    class DataProxy(object):
+        """
+        Proxy interface to the data which collects whole images and writes
+        them to the underlying data in one slab
+
+        """
+
+        def __init__(self, handle, nbuffer):
+            self.handle = handle
+            self.buffer = numpy.empty(
+                (nbuffer,) + tuple(handle.shape[1:]), dtype=handle.dtype
+            )
+            self.start = 0
+            self.count = 0
+
+        @property
+        def shape(self):
+            """
+            The shape property
+
+            """
+            return self.handle.shape
+
+        @property
+        def dtype(self):
+            """
+            The dtype property
+
+            """
+            return self.handle.dtype
+
+        def __getitem__(self, item):
+            self.flush()
+            return self.handle[item]
+
+        def __setitem__(self, item, data):
+
+            # Check if the item selects a whole image
+            if not isinstance(item, tuple):
+                item = (item,)
+            if not (
+                isinstance(item[0], (int, numpy.integer))
+                and all(i == slice(None) for i in item[1:])
+            ):
+                self.flush()
+                self.handle[item] = data
+                return
+
+            # Start a new block if the image does not follow the last one
+            index = range(self.shape[0])[item[0]]
+            if self.count > 0 and index != self.start + self.count:
+                self.flush()
+            if self.count == 0:
+                self.start = index
+
+            # Add the image to the block and write the block when full
+            self.buffer[self.count] = data
+            self.count += 1
+            if self.count == self.buffer.shape[0]:
+                self.flush()
+
+        def flush(self):
+            """
+            Write any buffered images
+
+            """
+            if self.count > 0:
+                stop = self.start + self.count
+                self.handle[self.start : stop] = self.buffer[: self.count]
+                self.count = 0
+
+    def __init__(self, writer, nbuffer=16):
+        """
+        Initialise the writer
+
+        Args:
+            writer (object): The writer to buffer
+            nbuffer (int): The number of images to buffer
+
+        """
+        self.writer = writer
+        self._data = BufferedWriter.DataProxy(writer.data, nbuffer)
+        self._angle = writer.angle
+        self._position = writer.position
+
+    @property
+    def shift(self):
+        """
+        The shift property
+
+        """
+        return self.writer.shift
+
+    @property
+    def pixel_size(self):
+        """
+        The pixel size
+
+        """
+        return self.writer.pixel_size
+
+    def update(self):
+        """
+        Write any buffered images and update the writer
+
+        """
+        self._data.flush()
+        self.writer.update()
+
+
 class Reader(object):
     """
     Interface to write the simulated data
@@ -512,6 +1041,7 @@ class Reader(object):
         self.pixel_size = pixel_size
         self.shape = data.shape
         self.dtype = data.dtype
+        self._step_position = None
 
     @property
     def start_angle(self):
@@ -570,21 +1100,22 @@ class Reader(object):
     def step_position(self):
         """
         Returns:
-            float: The stop position
+            float: The step position
 
         """
-        tol = 1e-7
-        if self.position.shape[0] > 1:
-            step = (self.position[-1, 1] - self.position[0, 1]) / (
-                self.position.shape[0] - 1
-            )
-            assert all(
-                abs((b - a) - step) < tol
-                for a, b in zip(self.position[0:-1, 1], self.position[1:1])
-            )
-        else:
-            step = 0
-        return step
+        if self._step_position is None:
+            y = numpy.asarray(self.position[:, 1], dtype=numpy.float64)
+            if y.shape[0] > 1:
+                step = (y[-1] - y[0]) / (y.shape[0] - 1)
+
+                # Check the positions are evenly spaced allowing for the
+                # rounding of positions stored as float32
+                tol = 1e-7 + 1e-5 * numpy.max(numpy.abs(y))
+                assert numpy.allclose(numpy.diff(y), step, rtol=0, atol=tol)
+            else:
+                step = 0
+            self._step_position = step
+        return self._step_position
 
     @property
     def num_images(self):
@@ -595,6 +1126,15 @@ class Reader(object):
         """
         return len(self.angle)
 
+    def close(self):
+        """
+        Close the file (if any)
+
+        """
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
     @classmethod
     def from_mrcfile(Class, filename):
         """
@@ -616,15 +1156,12 @@ class Reader(object):
 
             # Read the angles
             angle = numpy.zeros(handle.data.shape[0], dtype=numpy.float32)
-            for i in range(handle.extended_header.shape[0]):
-                angle[i] = handle.extended_header[i]["Alpha tilt"]
+            angle[:] = handle.extended_header["Alpha tilt"]
 
             # Read the positions
             position = numpy.zeros(shape=(handle.data.shape[0], 3), dtype=numpy.float32)
-            for i in range(handle.extended_header.shape[0]):
-                position[i, 0] = handle.extended_header[i]["Shift X"]
-                position[i, 1] = handle.extended_header[i]["Shift Y"]
-                position[i, 2] = 0
+            position[:, 0] = handle.extended_header["Shift X"]
+            position[:, 1] = handle.extended_header["Shift Y"]
         else:
             angle = numpy.zeros(handle.data.shape[0], dtype=numpy.float32)
             position = numpy.zeros(shape=(handle.data.shape[0], 3), dtype=numpy.float32)
@@ -632,8 +1169,12 @@ class Reader(object):
         # Get the pixel size
         pixel_size = handle.voxel_size["x"]
 
-        # Create the reader
-        return Reader(handle, handle.data, angle, position, pixel_size)
+        # Create the reader. The data is a plain array view of the memory map
+        # so that indexing does not create a new memmap object for each image.
+        # This is not a copy so casting the data to another dtype will read
+        # the whole file into memory.
+        data = numpy.asarray(handle.data)
+        return Reader(handle, data, angle, position, pixel_size)
 
     @classmethod
     def from_nexus(Class, filename):
@@ -645,8 +1186,11 @@ class Reader(object):
 
         """
 
-        # Read the data from disk
-        handle = h5py.File(filename, "r")
+        # Read the data from disk with a chunk cache sized for the data
+        with h5py.File(filename, "r") as handle:
+            dataset = handle["entry"]["data"]["data"]
+            cache = _chunk_cache(dataset.chunks, dataset.dtype)
+        handle = h5py.File(filename, "r", **cache)
 
         # Get the entry
         entry = handle["entry"]
@@ -660,10 +1204,13 @@ class Reader(object):
         data = entry["data"]
         detector = entry["instrument"]["detector"]
 
-        # Get the positions
-        position = numpy.array(
-            (data["x_translation"], data["y_translation"], data["z_translation"])
-        ).T
+        # Read each position column straight into a row of the array and
+        # return the transpose (a view) so no intermediate copy is made
+        fields = NexusWriter.PositionProxy.fields
+        position = numpy.empty((len(fields), data[fields[0]].shape[0]), numpy.float32)
+        for i, name in enumerate(fields):
+            data[name].read_direct(position[i])
+        position = position.T
 
         # Get the pixel size
         pixel_size = detector["x_pixel_size"][0]
@@ -682,16 +1229,26 @@ class Reader(object):
             filename (str): The output filename
 
         """
-        extension = os.path.splitext(filename)[1].lower()
-        if extension in [".mrc"]:
+        file_format = _file_format(filename)
+        if file_format == "mrc":
             return Class.from_mrcfile(filename)
-        elif extension in [".h5", ".hdf5", ".nx", ".nxs", ".nexus", "nxtomo"]:
+        elif file_format == "nexus":
             return Class.from_nexus(filename)
         else:
             raise RuntimeError(f"File with unknown extension: {filename}")
 
 
-def new(filename, shape=None, pixel_size=1, dtype="float32", vmin=None, vmax=None):
+def new(
+    filename,
+    shape=None,
+    pixel_size=1,
+    dtype="float32",
+    vmin=None,
+    vmax=None,
+    direct_chunk=False,
+    chunks=None,
+    compression=None,
+):
     """
     Create a new file for writing
 
@@ -702,17 +1259,23 @@ def new(filename, shape=None, pixel_size=1, dtype="float32", vmin=None, vmax=Non
         dtype (object): The data type (only used with NexusWriter)
         vmin (int): The minimum value (only used in ImageWriter)
         vmax (int): The maximum value (only used in ImageWriter)
+        direct_chunk (bool): Write images directly as chunks (only used with
+            NexusWriter)
+        chunks (tuple): The chunk shape (only used with NexusWriter)
+        compression (str): The compression filter (only used with NexusWriter)
 
     Returns:
         object: The file writer
 
     """
-    extension = os.path.splitext(filename)[1].lower()
-    if extension in [".mrc"]:
+    file_format = _file_format(filename)
+    if file_format == "mrc":
         return MrcFileWriter(filename, shape, pixel_size, dtype)
-    elif extension in [".h5", ".hdf5", ".nx", ".nxs", ".nexus", "nxtomo"]:
-        return NexusWriter(filename, shape, pixel_size, dtype)
-    elif extension in [".png", ".jpg", ".jpeg", ".tif", ".tiff"]:
+    elif file_format == "nexus":
+        return NexusWriter(
+            filename, shape, pixel_size, dtype, direct_chunk, chunks, compression
+        )
+    elif file_format == "image":
         return ImageWriter(filename, shape, vmin, vmax)
     else:
         raise RuntimeError(f"File with unknown extension: {filename}")
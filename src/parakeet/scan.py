@@ -23,8 +23,8 @@ class Scan(object):
 
         Args:
             axis (tuple): The rotation axis
-            angles (list): The rotation angles (units: degrees)
-            positions (list): The positions to shift (units: A)
+            angles (array): The rotation angles (units: degrees)
+            positions (array): The positions to shift (units: A)
             exposure_time (float): The exposure time (units: seconds)
 
         """
@@ -33,13 +33,13 @@ class Scan(object):
         else:
             self.axis = axis
         if angles is None:
-            self.angles = [0]
+            self.angles = numpy.zeros(shape=1)
         else:
-            self.angles = angles
+            self.angles = numpy.asarray(angles)
         if positions is None:
-            self.positions = numpy.zeros(shape=len(angles), dtype=numpy.float32)
+            self.positions = numpy.zeros(shape=len(self.angles), dtype=numpy.float32)
         else:
-            self.positions = positions
+            self.positions = numpy.asarray(positions)
         assert len(self.angles) == len(self.positions)
         self.exposure_time = exposure_time
 
@@ -52,6 +52,24 @@ class Scan(object):
         assert len(self.angles) == len(self.positions)
         return len(self.angles)
 
+    def truncate(self, num_images):
+        """
+        Get the scan up to the given number of images
+
+        Args:
+            num_images (int): The number of images to keep
+
+        Returns:
+            object: The truncated scan
+
+        """
+        return Scan(
+            axis=self.axis,
+            angles=self.angles[:num_images],
+            positions=self.positions[:num_images],
+            exposure_time=self.exposure_time,
+        )
+
 
 def new(
     mode="still",
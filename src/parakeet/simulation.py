@@ -13,6 +13,8 @@ import copy
 import logging
 import mrcfile
 import numpy
+import queue
+import threading
 import warnings
 import parakeet.config
 import parakeet.dqe
@@ -58,13 +60,15 @@ def create_system_configuration(device):
     Create an appropriate system configuration
 
     Args:
-        device (str): The device to use
+        device (str): The device to use (cpu, gpu or gpu:N to select a GPU)
 
     Returns:
         object: The system configuration
 
     """
+    device, _, gpu_device = device.partition(":")
     assert device in ["cpu", "gpu"]
+    assert gpu_device == "" or (device == "gpu" and gpu_device.isdigit())
 
     # Initialise the system configuration
     system_conf = multem.SystemConfiguration()
@@ -76,6 +80,8 @@ def create_system_configuration(device):
     if device == "gpu":
         if multem.is_gpu_available():
             system_conf.device = "device"
+            if gpu_device:
+                system_conf.gpu_device = int(gpu_device)
         else:
             system_conf.device = "host"
             warnings.warn("GPU not present, reverting to CPU")
@@ -216,6 +222,59 @@ def create_input_multislice(
     return input_multislice
 
 
+def is_cuda_out_of_memory(error):
+    """
+    Check if an error is from CUDA running out of memory
+
+    Args:
+        error (object): The exception
+
+    Returns:
+        bool: True if the GPU ran out of memory
+
+    """
+    message = str(error).lower()
+    if not isinstance(error, (MemoryError, RuntimeError)):
+        return False
+    return ("cuda" in message and "out of memory" in message) or (
+        "cudaerrormemoryallocation" in message
+    )
+
+
+def simulate_with_cpu_fallback(simulate_image, index):
+    """
+    Simulate a single image, retrying on the CPU if the GPU runs out of memory
+
+    Only the failing image is moved to the CPU so the other images are still
+    simulated on the GPU. Only simulators which set cpu_fallback (those where
+    MULTEM runs on the device) are retried and only for CUDA out of memory
+    errors, so host memory errors are raised as they are.
+
+    Args:
+        simulate_image (func): The image simulation function
+        index (int): The image index
+
+    Returns:
+        tuple: The simulation result
+
+    """
+    try:
+        return simulate_image(index)
+    except (MemoryError, RuntimeError) as error:
+        if not (
+            getattr(simulate_image, "cpu_fallback", False)
+            and str(simulate_image.device).startswith("gpu")
+            and is_cuda_out_of_memory(error)
+        ):
+            raise
+        logger.warning(
+            f"    Out of GPU memory for image {index+1}: retrying on the CPU"
+        )
+        simulate_image = copy.copy(simulate_image)
+        simulate_image.device = "cpu"
+        return simulate_image(index)
+
+
 class Simulation(object):
     """
     An object to wrap the simulation
@@ -255,11 +314,97 @@ class Simulation(object):
             nz = len(self.scan)
         return (nz, ny, nx)
 
+    @property
+    def tile_shape(self):
+        """
+        Return
+            tuple: The shape of the tile computed by each job (a whole image)
+
+        """
+        return self.shape[1:]
+
     def angles(self):
         if self.scan is None:
             return [0]
         return self.scan.angles
 
+    def _write(self, writer, index, angle, position, image, shift):
+        """
+        Write a single image
+
+        Args:
+            writer (object): The writer
+            index (int): The image index
+            angle (float): The rotation angle
+            position (float): The scan position
+            image (array): The image
+            shift (tuple): The image shift (if any)
+
+        """
+        writer.data[index, :, :] = image
+        writer.angle[index] = angle
+        writer.position[index] = (0, position, 0)
+        if shift:
+            writer.shift[index] = shift
+
+    def run_async(self, writer=None, nqueue=4):
+        """
+        Run the simulation, writing the images on a separate thread so that
+        writing each image overlaps with simulating the next one
+
+        Args:
+            writer (object): Write each image to disk
+            nqueue (int): The maximum number of images waiting to be written
+
+        """
+
+        # Nothing to overlap if there is no writer and the cluster executors
+        # already overlap the simulation with writing
+        if writer is None or not (
+            self.cluster is None or self.cluster["method"] is None
+        ):
+            return self.run(writer)
+
+        # Check the shape of the writer
+        assert writer.shape == self.shape
+
+        # Write the images from the queue until given None
+        images = queue.Queue(maxsize=nqueue)
+        errors = []
+
+        def write_images():
+            while True:
+                item = images.get()
+                if item is None:
+                    break
+                if not errors:
+                    try:
+                        self._write(writer, *item)
+                    except Exception as error:
+                        errors.append(error)
+
+        # Simulate the images and pass them to the writer thread
+        thread = threading.Thread(target=write_images)
+        thread.start()
+        try:
+            for i, angle in enumerate(self.angles()):
+                if errors:
+                    break
+                logger.info(
+                    f"    Running job: {i+1}/{self.shape[0]} for {angle} degrees"
+                )
+                _, angle, position, image, shift = simulate_with_cpu_fallback(
+                    self.simulate_image, i
+                )
+                images.put((i, angle, position, image, shift))
+        finally:
+            images.put(None)
+            thread.join()
+
+        # Raise any error from writing
+        if errors:
+            raise errors[0]
+
     def run(self, writer=None):
         """
         Run the simulation
@@ -279,13 +424,11 @@ class Simulation(object):
                 logger.info(
                     f"    Running job: {i+1}/{self.shape[0]} for {angle} degrees"
                 )
-                _, angle, position, image, shift = self.simulate_image(i)
+                _, angle, position, image, shift = simulate_with_cpu_fallback(
+                    self.simulate_image, i
+                )
                 if writer:
-                    writer.data[i, :, :] = image
-                    writer.angle[i] = angle
-                    writer.position[i] = (0, position, 0)
-                    if shift:
-                        writer.shift[i] = shift
+                    self._write(writer, i, angle, position, image, shift)
         else:
 
             # Set the maximum number of workers
@@ -307,19 +450,21 @@ class Simulation(object):
                     logger.info(
                         f"    Submitting job: {i+1}/{self.shape[0]} for {angle} degrees"
                     )
-                    futures.append(executor.submit(self.simulate_image, i))
+                    futures.append(
+                        executor.submit(
+                            simulate_with_cpu_fallback, self.simulate_image, i
+                        )
+                    )
 
                 # Wait for results
                 for j, future in enumerate(parakeet.futures.as_completed(futures)):
 
                     # Get the result
-                    i, angle, position, image = future.result()
+                    i, angle, position, image, shift = future.result()
 
                     # Set the output in the writer
                     if writer:
-                        writer.data[i, :, :] = image
-                        writer.angle[i] = angle
-                        writer.position[i] = (0, position, 0)
+                        self._write(writer, i, angle, position, image, shift)
 
                     # Write some info
                     vmin = numpy.min(image)
@@ -501,6 +646,9 @@ class ExitWaveImageSimulator(object):
 
     """
 
+    # MULTEM can simulate an image on the CPU if the GPU runs out of memory
+    cpu_fallback = True
+
     def __init__(
         self, microscope=None, sample=None, scan=None, simulation=None, device="gpu"
     ):
@@ -795,6 +943,9 @@ class OpticsImageSimulator(object):
 
     """
 
+    # MULTEM can simulate an image on the CPU if the GPU runs out of memory
+    cpu_fallback = True
+
     def __init__(
         self,
         microscope=None,
@@ -1083,6 +1234,42 @@ class OpticsImageSimulator(object):
         return (index, angle, position, image, None)
 
 
+def clip_counts(image, dtype):
+    """
+    Convert the image counts to the output data type
+
+    The counts are clipped to the range of an integer or half precision type
+    and a warning is logged if any integer counts are clipped. Half precision
+    only holds integer counts exactly up to 2048 so a warning is also logged
+    if the counts exceed this.
+
+    Args:
+        image (array): The image counts
+        dtype (object): The output data type
+
+    Returns:
+        array: The image in the output data type
+
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind in "iu":
+        num_clipped = numpy.count_nonzero(image > numpy.iinfo(dtype).max)
+        if num_clipped > 0:
+            logger.warning(
+                "    Clipped %d pixels with counts above the %s max of %d"
+                % (num_clipped, dtype, numpy.iinfo(dtype).max)
+            )
+        image = numpy.clip(image, 0, numpy.iinfo(dtype).max)
+    elif dtype == numpy.float16:
+        if numpy.max(image) > 2048:
+            logger.warning(
+                "    Image max %g exceeds 2048 so counts will be rounded in float16"
+                % numpy.max(image)
+            )
+        image = numpy.clip(image, 0, numpy.finfo(dtype).max)
+    return image.astype(dtype)
+
+
 class ImageSimulator(object):
     """
     A class to do the actual simulation
@@ -1094,13 +1281,20 @@ class ImageSimulator(object):
     """
 
     def __init__(
-        self, microscope=None, optics=None, scan=None, simulation=None, device="gpu"
+        self,
+        microscope=None,
+        optics=None,
+        scan=None,
+        simulation=None,
+        device="gpu",
+        dtype="float32",
     ):
         self.microscope = microscope
         self.optics = optics
         self.scan = scan
         self.simulation = simulation
         self.device = device
+        self.dtype = numpy.dtype(dtype)
 
     def __call__(self, index):
         """
@@ -1176,7 +1370,7 @@ class ImageSimulator(object):
         #     image = image / electrons_per_pixel
 
         # Compute the image scaled with Poisson noise
-        return (index, angle, position, image.astype("float32"), None)
+        return (index, angle, position, clip_counts(image, self.dtype), None)
 
 
 class CTFSimulator(object):
@@ -1449,7 +1643,13 @@ def optics(
 
 
 def image(
-    microscope=None, optics=None, scan=None, device="gpu", simulation=None, cluster=None
+    microscope=None,
+    optics=None,
+    scan=None,
+    device="gpu",
+    simulation=None,
+    cluster=None,
+    dtype="float32",
 ):
     """
     Create the simulation
@@ -1461,6 +1661,8 @@ def image(
         device (str): The device to use
         simulation (object): The simulation parameters
         cluster (object): The cluster parameters
+        dtype (str): The data type of the image (float32, float16 or uint16).
+            Note that float16 only holds integer counts exactly up to 2048
 
     Returns:
         object: The simulation object
@@ -1479,6 +1681,7 @@ def image(
             scan=scan,
             simulation=simulation,
             device=device,
+            dtype=dtype,
         ),
     )
 
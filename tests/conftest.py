@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+
+    # Keep the parsed config cache out of the user's home directory
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
@@ -0,0 +1,115 @@
+import numpy
+import os
+import pytest
+import parakeet.command_line
+import parakeet.io
+
+
+def test_rebin():
+
+    data = numpy.arange(4 * 6, dtype=numpy.float32).reshape((4, 6))
+
+    result = parakeet.command_line.rebin(data, (2, 3))
+    expected = numpy.array([[3.5, 5.5, 7.5], [15.5, 17.5, 19.5]])
+    assert result.shape == (2, 3)
+    assert numpy.allclose(result, expected)
+
+    result = parakeet.command_line.rebin(data + 1j * data, (2, 3))
+    assert numpy.allclose(result, expected + 1j * expected)
+
+
+def test_export_args():
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parakeet.command_line._add_export_args(parser)
+    args = parser.parse_args(["in.h5", "-o", "out.h5", "--roi", "1,2,3,4"])
+    assert args.roi == (1, 2, 3, 4)
+    args = parser.parse_args(
+        ["in.h5", "-o", "out.h5", "--rotation_range", "0,10;20,30"]
+    )
+    assert args.rotation_range == [(0, 10), (20, 30)]
+
+    for argv in [
+        ["in.h5", "-o", "out.h5", "--roi", "1,2"],
+        ["in.h5", "-o", "out.h5", "--roi", "1,2,a,4"],
+        ["in.h5", "-o", "out.h5", "--select_images", "0,10,1,2"],
+        ["in.h5", "-o", "out.h5", "--rotation_range", "0,10;20"],
+    ]:
+        with pytest.raises(SystemExit):
+            parser.parse_args(argv)
+
+
+def test_export_closes_input(tmp_path):
+
+    filename = os.path.join(tmp_path, "input.h5")
+    output = os.path.join(tmp_path, "output.h5")
+
+    data = numpy.arange(2 * 4 * 6, dtype=numpy.float32).reshape((2, 4, 6))
+    writer = parakeet.io.new(filename, shape=data.shape)
+    writer.data[:] = data
+    writer = None
+
+    parakeet.command_line.export([filename, "-o", output])
+
+    # The input can be overwritten after export has returned
+    writer = parakeet.io.new(filename, shape=data.shape)
+    writer = None
+
+    reader = parakeet.io.open(output)
+    assert numpy.all(numpy.equal(reader.data[:], data))
+
+
+def test_simulate_all_stages_header_stats(tmp_path, monkeypatch):
+
+    import mrcfile
+    import yaml
+    import parakeet.command_line.simulate
+    import parakeet.config
+    import parakeet.sample
+    import parakeet.simulation
+
+    monkeypatch.chdir(tmp_path)
+
+    # Write a small configuration
+    config = parakeet.config.load()
+    config["microscope"]["detector"]["nx"] = 16
+    config["microscope"]["detector"]["ny"] = 12
+    config["scan"]["mode"] = "tilt_series"
+    config["scan"]["num_images"] = 4
+    config["scan"]["step_angle"] = 10
+    with open("config.yaml", "w") as outfile:
+        yaml.safe_dump(config, outfile)
+
+    # Replace the sample and the simulations with ones which need no MULTEM.
+    # Image i is filled with the value i
+    class Sample(object):
+        shape_radius = 100.0
+        containing_box = ((0, 0, 0), (500, 500, 500))
+
+    def simulation(microscope=None, scan=None, cluster=None, **kwargs):
+        def simulate_image(i):
+            image = numpy.full((12, 16), float(i))
+            return (i, scan.angles[i], scan.positions[i], image, None)
+
+        return parakeet.simulation.Simulation(
+            (16, 12), 1, scan=scan, cluster=cluster, simulate_image=simulate_image
+        )
+
+    monkeypatch.setattr(parakeet.sample, "load", lambda filename: Sample())
+    monkeypatch.setattr(parakeet.simulation, "exit_wave", simulation)
+    monkeypatch.setattr(parakeet.simulation, "optics", simulation)
+    monkeypatch.setattr(parakeet.simulation, "image", simulation)
+
+    parakeet.command_line.simulate.all_stages(
+        ["-c", "config.yaml", "-s", "sample.h5", "-o", "optics.mrc", "-i", "image.mrc"]
+    )
+
+    # The header statistics of the saved optics and the image are set
+    for filename in ["optics.mrc", "image.mrc"]:
+        with mrcfile.open(filename) as handle:
+            assert handle.header.dmin == 0
+            assert handle.header.dmax == 3
+            assert handle.header.dmean == 1.5
+            assert handle.header.rms == pytest.approx(numpy.sqrt(1.25))
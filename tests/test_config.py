@@ -95,3 +95,30 @@ def test_load(tmp_path):
 def test_show():
 
     parakeet.config.show({})
+
+
+def test_read_yaml(tmp_path):
+
+    filename = os.path.join(tmp_path, "tmp.yaml")
+    with open(filename, "w") as outfile:
+        yaml.dump({"A": 10, "B": str(tmp_path)}, outfile)
+
+    assert parakeet.config.read_yaml(filename) == {"A": 10, "B": str(tmp_path)}
+    assert len(os.listdir(os.path.join(tmp_path, "parakeet"))) == 1
+    parakeet.config.read_yaml(filename)["A"] = 30
+    assert parakeet.config.read_yaml(filename) == {"A": 10, "B": str(tmp_path)}
+
+    with open(filename, "w") as outfile:
+        yaml.dump({"A": 20}, outfile)
+
+    assert parakeet.config.read_yaml(filename) == {"A": 20}
+    assert len(os.listdir(os.path.join(tmp_path, "parakeet"))) == 2
+
+
+def test_parse_yaml_prunes_cache(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(parakeet.config, "_MAX_CACHE_FILES", 3)
+
+    for i in range(5):
+        assert parakeet.config._parse_yaml(f"A: {i}".encode()) == {"A": i}
+    assert len(os.listdir(os.path.join(tmp_path, "parakeet"))) == 3
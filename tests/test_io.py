@@ -1,3 +1,4 @@
+import h5py
 import numpy
 import os
 import pytest
@@ -48,17 +49,42 @@ def test_read_write_mrcfile(tmp_path, io_test_data):
     writer.position[2, :] = position[2]
     writer.position[3, 0:2] = position[3][0:2]
     writer.position[3, 2] = position[3][2]
+    writer.position[4:6, :] = position[4:6]
 
     # Make sure stuff is written
     writer = None
 
     reader = parakeet.io.open(filename)
     assert reader.data.shape == (10, 100, 100)
+    assert type(reader.data) is numpy.ndarray
     assert reader.angle.shape == (10,)
     assert numpy.all(numpy.equal(reader.angle, angle))
     assert numpy.all(numpy.equal(reader.position, position))
 
 
+def test_mrcfile_header_stats(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.mrc")
+
+    data, angle, position = io_test_data
+
+    # The statistics of whole images are combined
+    writer = parakeet.io.new(filename, shape=data.shape, dtype="float32")
+    for i in range(data.shape[0]):
+        writer.data[i, :, :] = data[i, :, :]
+    writer.update()
+    header = writer.handle.header
+    assert header.dmin == numpy.min(data)
+    assert header.dmax == numpy.max(data)
+    assert header.dmean == pytest.approx(numpy.mean(data, dtype=numpy.float64))
+    assert header.rms == pytest.approx(numpy.std(data, dtype=numpy.float64))
+
+    # Partly written images are rescanned
+    writer.data[0, 0:50, :] = -1
+    writer.update()
+    assert writer.handle.header.dmin == -1
+
+
 def test_write_nexus(tmp_path, io_test_data):
 
     filename = os.path.join(tmp_path, "tmp.h5")
@@ -83,17 +109,229 @@ def test_write_nexus(tmp_path, io_test_data):
     writer.position[2, :] = position[2]
     writer.position[3, 0:2] = position[3][0:2]
     writer.position[3, 2] = position[3][2]
+    writer.position[4:6, :] = position[4:6]
 
     # Make sure stuff is written
     writer = None
 
     reader = parakeet.io.open(filename)
     assert reader.data.shape == (10, 100, 100)
+    assert reader.data.chunks == (1, 100, 100)
     assert reader.angle.shape == (10,)
     assert numpy.all(numpy.equal(reader.angle, angle))
     assert numpy.all(numpy.equal(reader.position, position))
 
 
+def test_write_nexus_empty(tmp_path):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    writer = parakeet.io.new(filename, shape=(0, 10, 10))
+    assert writer.shape == (0, 10, 10)
+
+    # Make sure stuff is written
+    writer = None
+
+    with h5py.File(filename, "r") as handle:
+        assert handle["entry/data/data"].shape == (0, 10, 10)
+
+
+def test_write_nexus_direct_chunk(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.new(filename, shape=data.shape, direct_chunk=True)
+    for i in range(data.shape[0] - 2):
+        writer.data[i, :, :] = data[i, :, :]
+    writer.data[-2] = data[-2]
+    writer.data[-1, 0:50, :] = data[-1, 0:50, :]
+    writer.data[-1, 50:, :] = data[-1, 50:, :]
+    writer.angle[:] = angle
+    writer.position[:, :] = position
+
+    assert writer.shape == data.shape
+    assert writer.is_nexus_writer == True
+
+    # Make sure stuff is written
+    writer = None
+
+    reader = parakeet.io.open(filename)
+    assert reader.data.shape == (10, 100, 100)
+    assert numpy.all(numpy.equal(reader.data[:], data))
+    assert numpy.all(numpy.equal(reader.angle, angle))
+    assert numpy.all(numpy.equal(reader.position, position))
+
+
+def test_write_nexus_float16(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.new(
+        filename, shape=data.shape, dtype="float16", direct_chunk=True
+    )
+    for i in range(data.shape[0]):
+        writer.data[i, :, :] = data[i, :, :]
+
+    assert writer.dtype == "float16"
+
+    # Make sure stuff is written
+    writer = None
+
+    reader = parakeet.io.open(filename)
+    assert reader.dtype == "float16"
+    assert numpy.all(numpy.equal(reader.data[:], data.astype("float16")))
+
+
+def test_write_nexus_chunked_compressed(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.new(
+        filename,
+        shape=data.shape,
+        direct_chunk=True,
+        chunks=(1, 50, 50),
+        compression="gzip",
+    )
+    for i in range(data.shape[0]):
+        writer.data[i, :, :] = data[i, :, :]
+    writer.angle[:] = angle
+    writer.position[:, :] = position
+
+    # Make sure stuff is written
+    writer = None
+
+    with h5py.File(filename, "r") as handle:
+        dataset = handle["entry/data/data"]
+        assert dataset.chunks == (1, 50, 50)
+        assert dataset.compression == "gzip"
+        assert dataset.shuffle
+        assert numpy.all(numpy.equal(dataset[:], data))
+
+
+def test_write_nexus_lzf(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.new(filename, shape=data.shape, compression="lzf")
+    for i in range(data.shape[0]):
+        writer.data[i, :, :] = data[i, :, :]
+
+    # Make sure stuff is written
+    writer = None
+
+    with h5py.File(filename, "r") as handle:
+        dataset = handle["entry/data/data"]
+        assert dataset.chunks == (1, 100, 100)
+        assert dataset.compression == "lzf"
+        assert dataset.shuffle
+        assert numpy.all(numpy.equal(dataset[:], data))
+
+
+def test_write_nexus_blosc(tmp_path, io_test_data):
+
+    hdf5plugin = pytest.importorskip("hdf5plugin")
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+    data = data + 1j * data[::-1]
+
+    writer = parakeet.io.new(
+        filename,
+        shape=data.shape,
+        dtype="complex64",
+        direct_chunk=True,
+        compression="blosc",
+    )
+    for i in range(data.shape[0] - 1):
+        writer.data[i, :, :] = data[i, :, :]
+    writer.data[-1, 0:50, :] = data[-1, 0:50, :]
+    writer.data[-1, 50:, :] = data[-1, 50:, :]
+    writer.angle[:] = angle
+    writer.position[:, :] = position
+
+    # Make sure stuff is written
+    writer = None
+
+    reader = parakeet.io.open(filename)
+    assert reader.data.dtype == "complex64"
+    plist = reader.handle["entry/data/data"].id.get_create_plist()
+    assert plist.get_filter(0)[0] == hdf5plugin.BLOSC_ID
+    assert numpy.all(numpy.equal(reader.data[:], data))
+
+
+def test_memory_writer(io_test_data):
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.MemoryWriter(shape=data.shape, pixel_size=2)
+    for i in range(data.shape[0]):
+        writer.data[i, :, :] = data[i, :, :]
+        writer.angle[i] = angle[i]
+        writer.position[i] = position[i]
+
+    assert writer.shape == data.shape
+    assert writer.dtype == "float32"
+
+    reader = writer.as_reader()
+    assert reader.data.shape == (10, 100, 100)
+    assert reader.pixel_size == 2
+    assert reader.step_position == 1
+    assert numpy.all(numpy.equal(reader.data, data))
+    assert numpy.all(numpy.equal(reader.angle, angle))
+    assert numpy.all(numpy.equal(reader.position, position))
+
+
+def test_step_position(io_test_data):
+
+    data, angle, position = io_test_data
+
+    position = position.astype("float32") * 3.3
+    reader = parakeet.io.Reader(None, data, angle, position, 1)
+    assert reader.step_position == pytest.approx(3.3)
+
+    position[5, 1] += 1
+    reader = parakeet.io.Reader(None, data, angle, position, 1)
+    with pytest.raises(AssertionError):
+        reader.step_position
+
+
+def test_buffered_writer(tmp_path, io_test_data):
+
+    filename = os.path.join(tmp_path, "tmp.h5")
+
+    data, angle, position = io_test_data
+
+    writer = parakeet.io.BufferedWriter(
+        parakeet.io.new(filename, shape=data.shape), nbuffer=4
+    )
+    for i in [0, 1, 2, 3, 4, 5, 9, 6, 7, 8]:
+        writer.data[i, :, :] = data[i, :, :]
+        writer.angle[i] = angle[i]
+        writer.position[i] = position[i]
+    writer.update()
+
+    assert writer.shape == data.shape
+    assert numpy.all(numpy.equal(writer.data[:], data))
+
+    # Make sure stuff is written
+    writer = None
+
+    reader = parakeet.io.open(filename)
+    assert numpy.all(numpy.equal(reader.data[:], data))
+    assert numpy.all(numpy.equal(reader.angle, angle))
+    assert numpy.all(numpy.equal(reader.position, position))
+
+
 def test_write_images(tmp_path, io_test_data):
 
     filename = os.path.join(tmp_path, "tmp_%03d.png")
@@ -8,6 +8,8 @@ def test_still():
     assert scan.axis == (0, 1, 0)
     assert scan.angles == [0]
     assert scan.positions == [0]
+    assert isinstance(scan.angles, numpy.ndarray)
+    assert isinstance(scan.positions, numpy.ndarray)
 
 
 def test_tilt_series():
@@ -34,6 +36,15 @@ def test_helical_scan():
     assert numpy.all(numpy.equal(scan.positions, [0, 10, 20, 30, 40, 50, 60, 70]))
 
 
+def test_truncate():
+    scan = parakeet.scan.new(
+        mode="helical_scan", num_images=8, step_angle=45, step_pos=10
+    ).truncate(3)
+    assert len(scan) == 3
+    assert numpy.all(numpy.equal(scan.angles, [0, 45, 90]))
+    assert numpy.all(numpy.equal(scan.positions, [0, 10, 20]))
+
+
 def test_unknown():
 
     with pytest.raises(RuntimeError):
@@ -0,0 +1,173 @@
+import numpy
+import pytest
+import threading
+import time
+import parakeet.io
+import parakeet.scan
+import parakeet.simulation
+
+
+class FakeSimulator(object):
+    """
+    A fake image simulator which records the device used for each image
+
+    """
+
+    cpu_fallback = True
+
+    def __init__(self, scan, error=None, error_index=None, device="gpu"):
+        self.scan = scan
+        self.error = error
+        self.error_index = error_index
+        self.device = device
+        self.calls = []
+
+    def __call__(self, index):
+        self.calls.append((index, self.device))
+        if index == self.error_index and self.device == "gpu":
+            raise self.error
+        image = numpy.full((12, 16), float(index))
+        return (index, self.scan.angles[index], self.scan.positions[index], image, None)
+
+
+def make_simulation(simulate_image):
+    return parakeet.simulation.Simulation(
+        (16, 12), 1, scan=simulate_image.scan, simulate_image=simulate_image
+    )
+
+
+def test_cpu_fallback():
+
+    scan = parakeet.scan.new("tilt_series", num_images=4, step_angle=10)
+    simulate_image = FakeSimulator(
+        scan, RuntimeError("CUDA error: out of memory"), error_index=2
+    )
+    writer = parakeet.io.MemoryWriter((4, 12, 16), 1)
+    make_simulation(simulate_image).run(writer)
+
+    # Only the failed image is simulated again on the CPU
+    assert simulate_image.calls == [
+        (0, "gpu"),
+        (1, "gpu"),
+        (2, "gpu"),
+        (2, "cpu"),
+        (3, "gpu"),
+    ]
+    assert simulate_image.device == "gpu"
+    for i in range(4):
+        assert numpy.all(writer.data[i] == i)
+
+
+@pytest.mark.parametrize(
+    "error, cpu_fallback",
+    [
+        (MemoryError(), True),
+        (RuntimeError("Something else"), True),
+        (RuntimeError("CUDA error: out of memory"), False),
+    ],
+)
+def test_cpu_fallback_not_used(error, cpu_fallback):
+
+    scan = parakeet.scan.new("tilt_series", num_images=4, step_angle=10)
+    simulate_image = FakeSimulator(scan, error, error_index=1)
+    simulate_image.cpu_fallback = cpu_fallback
+    with pytest.raises(type(error)):
+        make_simulation(simulate_image).run()
+    assert simulate_image.calls == [(0, "gpu"), (1, "gpu")]
+
+
+def test_run_async():
+
+    scan = parakeet.scan.new("tilt_series", num_images=10, step_angle=10)
+    simulate_image = FakeSimulator(scan)
+    writer = parakeet.io.MemoryWriter((10, 12, 16), 1)
+    threads = threading.active_count()
+    make_simulation(simulate_image).run_async(writer, nqueue=2)
+
+    # Every image is written and the writer thread has finished
+    assert threading.active_count() == threads
+    assert [i for i, device in simulate_image.calls] == list(range(10))
+    for i in range(10):
+        assert numpy.all(writer.data[i] == i)
+        assert writer.angle[i] == scan.angles[i]
+
+
+def test_run_async_writer_error():
+    class FailingData(object):
+        """
+        Data which fails to write the second image
+
+        """
+
+        def __init__(self, data):
+            self.data = data
+            self.shape = data.shape
+            self.failed = threading.Event()
+
+        def __setitem__(self, item, value):
+            if item[0] == 1:
+                self.failed.set()
+                raise OSError("Disk full")
+            self.data[item] = value
+
+    # Wait for the writer to fail before simulating the third image so the
+    # simulation should stop before simulating the rest
+    scan = parakeet.scan.new("tilt_series", num_images=20, step_angle=10)
+    writer = parakeet.io.MemoryWriter((20, 12, 16), 1)
+    writer._data = FailingData(writer._data)
+    simulate_image = FakeSimulator(scan)
+
+    def wait_for_error(index):
+        if index == 2:
+            assert writer.data.failed.wait(timeout=10)
+            time.sleep(0.1)
+        return simulate_image(index)
+
+    simulation = make_simulation(simulate_image)
+    simulation.simulate_image = wait_for_error
+    threads = threading.active_count()
+    with pytest.raises(OSError, match="Disk full"):
+        simulation.run_async(writer)
+
+    # The error is raised once the writer thread has finished
+    assert threading.active_count() == threads
+    assert len(simulate_image.calls) < 20
+    assert numpy.all(writer.data.data[0] == 0)
+
+
+def test_run_async_simulation_error():
+
+    scan = parakeet.scan.new("tilt_series", num_images=10, step_angle=10)
+    simulate_image = FakeSimulator(scan, ValueError("Bad image"), error_index=3)
+    writer = parakeet.io.MemoryWriter((10, 12, 16), 1)
+    threads = threading.active_count()
+    with pytest.raises(ValueError, match="Bad image"):
+        make_simulation(simulate_image).run_async(writer)
+
+    # The images before the error are written and the writer thread finished
+    assert threading.active_count() == threads
+    assert len(simulate_image.calls) == 4
+    for i in range(3):
+        assert numpy.all(writer.data[i] == i)
+
+
+def test_clip_counts_float16(caplog):
+
+    image = numpy.array([0, 1000, 2048], dtype=numpy.float64)
+    result = parakeet.simulation.clip_counts(image, "float16")
+    assert result.dtype == numpy.float16
+    assert numpy.all(result == image)
+    assert "exceeds 2048" not in caplog.text
+
+    result = parakeet.simulation.clip_counts(image + 1, "float16")
+    assert result[2] == 2048
+    assert "exceeds 2048" in caplog.text
+
+
+def test_clip_counts_uint16(caplog):
+
+    image = numpy.array([0, 1000, 65535, 70000, 80000], dtype=numpy.float64)
+    result = parakeet.simulation.clip_counts(image, "uint16")
+    assert result.dtype == numpy.uint16
+    assert list(result) == [0, 1000, 65535, 65535, 65535]
+    assert "Clipped 2 pixels" in caplog.text